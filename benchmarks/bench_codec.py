@@ -0,0 +1,130 @@
+"""Микробенчмарки горячих функций: Base62 и перестановка кодов, L1 кэш, записи кэша и сериализация моделей.
+
+Каждая операция выполняется --number раз в --repeat повторах, в отчет идет
+лучший повтор в наносекундах на операцию (для пакетных - на один элемент).
+Прежняя реализация Base62 (divmod по одной цифре и ALPHABET.index)
+замеряется рядом для сравнения.
+
+Запуск: python -m benchmarks.bench_codec --number 100000 --report codec.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import timeit
+from datetime import datetime, timedelta
+
+BATCH = 10000
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=100000, help="Вызовов в одном повторе")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--report", help="Файл JSON отчета (по умолчанию только таблица)")
+    return parser.parse_args()
+
+def legacy_encode(num, alphabet):
+    if num == 0:
+        return alphabet[0]
+    arr = []
+    while num:
+        num, rem = divmod(num, len(alphabet))
+        arr.append(alphabet[rem])
+    return ''.join(reversed(arr))
+
+def legacy_decode(string, alphabet):
+    res = 0
+    for char in string:
+        res = res * len(alphabet) + alphabet.index(char)
+    return res
+
+def measure(func, number: int, repeat: int, items: int = 1) -> float:
+    """Лучшее время одного вызова (или одного элемента пачки) в нс."""
+    best = min(timeit.repeat(func, number=number, repeat=repeat))
+    return round(best / number / items * 1e9, 1)
+
+def cases(args):
+    """Возвращает [(группа, операция, функция, элементов за вызов)]."""
+    import src.utils as utils
+    from src.cache import LocalCache, should_refresh_early
+    from src.models import LinkInfo, LinkStatsInfo
+    from src.records import CachedLink, pack_link, unpack_link
+    from src.short_codes import short_codes
+
+    rng = random.Random(args.seed)
+    ids = [rng.randrange(62 ** 6, 62 ** 7) for _ in range(BATCH)]
+    codes = [utils.encode(num) for num in ids]
+    num, code = ids[0], codes[0]
+    obfuscated = short_codes.encode(num % short_codes.domain)
+
+    l1 = LocalCache(maxsize=BATCH, ttl=60)
+    for item in codes:
+        l1.set(item, "https://example.com/")
+    now = datetime.utcnow()
+    record = CachedLink("https://example.com/some/long/path?q=1", now, now + timedelta(days=1), 42)
+    packed = pack_link(record)
+    info = LinkInfo(short_code=code, original_url=record.url, created_at=now, expires_at=None)
+    stats = LinkStatsInfo(
+        short_code=code, original_url=record.url, created_at=now, expires_at=None,
+        clicks=100, clicks_by_hour={f"{h:02d}": h for h in range(24)}
+    )
+
+    result = [
+        ("base62", "encode (legacy)", lambda: legacy_encode(num, utils.ALPHABET), 1),
+        ("base62", "encode", lambda: utils.encode(num), 1),
+        ("base62", "decode (legacy)", lambda: legacy_decode(code, utils.ALPHABET), 1),
+        ("base62", "decode", lambda: utils.decode(code), 1),
+        ("base62", "is_base62", lambda: utils.is_base62(code, 16), 1),
+        ("base62", "encode_many list", lambda: utils.encode_many(ids), BATCH),
+        ("base62", "decode_many list", lambda: utils.decode_many(codes), BATCH),
+        ("base62", "short_codes.encode", lambda: short_codes.encode(num % short_codes.domain), 1),
+        ("base62", "short_codes.decode", lambda: short_codes.decode(obfuscated), 1),
+    ]
+    if utils.np is not None:
+        array = utils.np.array(ids, dtype=utils.np.int64)
+        result += [
+            ("base62", "encode_many numpy", lambda: utils.encode_many(array), BATCH),
+            ("base62", "decode_many numpy", lambda: utils.decode_many(codes, as_array=True), BATCH),
+        ]
+    result += [
+        ("cache", "LocalCache.get hit", lambda: l1.get(code), 1),
+        ("cache", "LocalCache.get miss", lambda: l1.get("missing"), 1),
+        ("cache", "LocalCache.set", lambda: l1.set(code, record.url), 1),
+        ("cache", "should_refresh_early", lambda: should_refresh_early(600), 1),
+        ("cache", "pack_link", lambda: pack_link(record), 1),
+        ("cache", "unpack_link", lambda: unpack_link(packed), 1),
+        ("models", "LinkInfo validate", lambda: LinkInfo(
+            short_code=code, original_url=record.url, created_at=now, expires_at=None), 1),
+        ("models", "LinkInfo dump_json", info.model_dump_json, 1),
+        ("models", "LinkStatsInfo dump_json", stats.model_dump_json, 1),
+    ]
+    return result
+
+def main(args):
+    report = {
+        "started_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "config": {"number": args.number, "repeat": args.repeat, "seed": args.seed},
+        "results": {}
+    }
+    for group, name, func, items in cases(args):
+        # Пакетные операции уже обрабатывают BATCH элементов за вызов
+        number = max(1, args.number // items)
+        ns = measure(func, number, args.repeat, items)
+        report["results"].setdefault(group, {})[name] = ns
+        print(f"{group:8} {name:28} {ns:>10.1f} нс")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+if __name__ == "__main__":
+    args = parse_args()
+    # src.config читает окружение при импорте; БД не используется, но движок создается при импорте
+    os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite://")
+    os.environ.setdefault("REDIS_HOST", "localhost")
+    os.environ.setdefault("REDIS_PORT", "6379")
+    os.environ.setdefault("SHORT_CODE_SECRET", "bench")
+    main(args)
@@ -0,0 +1,250 @@
+"""Воспроизводимый нагрузочный бенчмарк API: холодный и теплый кэш, смешанная нагрузка.
+
+По умолчанию приложение запускается в этом же процессе (httpx + ASGI
+транспорт) на временной SQLite и in-process fakeredis, поэтому прогон
+не требует ни сервера, ни Redis. С --base-url нагрузка идет на уже
+запущенный сервер.
+
+Сценарии:
+    cold  - каждый код запрашивается один раз сразу после создания (промахи кэша);
+    warm  - Zipf-распределенные редиректы после прогрева;
+    mixed - редиректы, /stats, создание, изменение и удаление ссылок
+            авторизованным пользователем (доли в workload.MIXED_WEIGHTS).
+
+Отчет (p50/p95/p99 и пропускная способность по операциям) пишется в JSON.
+
+Запуск: python -m benchmarks.bench_load --links 2000 --requests 20000 --report report.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import httpx
+
+from benchmarks.workload import MIXED_WEIGHTS, ZipfSampler, latency_summary, weighted_choice
+
+CREATE_BATCH = 1000
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default="cold,warm,mixed", help="Через запятую: cold,warm,mixed")
+    parser.add_argument("--links", type=int, default=2000, help="Число ссылок в наборе")
+    parser.add_argument("--requests", type=int, default=20000, help="Запросов в сценариях warm и mixed")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--zipf", type=float, default=1.1, help="Параметр s распределения Zipf")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--base-url", help="Нагружать запущенный сервер вместо приложения в процессе")
+    parser.add_argument("--redis", choices=("fake", "real"), default="fake",
+                        help="fake - in-process fakeredis, real - REDIS_HOST/REDIS_PORT (только без --base-url)")
+    parser.add_argument("--url", help="URL базы (по умолчанию временный файл SQLite)")
+    parser.add_argument("--report", help="Файл JSON отчета (по умолчанию stdout)")
+    return parser.parse_args()
+
+class Recorder:
+    """Собирает задержки и ошибки по операциям одного сценария."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def request(self, client: httpx.AsyncClient, operation: str, method: str, url: str, expected: tuple, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[operation] += 1
+            return None
+        self.samples[operation].append(time.perf_counter() - start)
+        if response.status_code not in expected:
+            self.errors[operation] += 1
+        return response
+
+    def report(self, duration: float) -> dict:
+        operations = sorted(set(self.samples) | set(self.errors))
+        total = sum(len(samples) for samples in self.samples.values())
+        return {
+            "duration_s": round(duration, 3),
+            "requests": total,
+            "throughput_rps": round(total / duration, 1) if duration > 0 else 0.0,
+            "operations": {
+                operation: latency_summary(self.samples[operation], self.errors[operation], duration)
+                for operation in operations
+            }
+        }
+
+async def run_concurrently(jobs, concurrency: int):
+    """Выполняет корутины из итератора jobs, держа не больше concurrency одновременно."""
+    jobs = iter(jobs)
+
+    async def worker():
+        for job in jobs:
+            await job
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+
+async def create_links(client: httpx.AsyncClient, count: int, tag: str, headers: dict | None = None) -> list[str]:
+    """Создает count ссылок пачками через /links/shorten/batch и возвращает их коды."""
+    codes = []
+    for offset in range(0, count, CREATE_BATCH):
+        batch = [
+            {"original_url": f"https://bench.example.com/{tag}/{i}"}
+            for i in range(offset, min(offset + CREATE_BATCH, count))
+        ]
+        response = await client.post("/links/shorten/batch", json=batch, headers=headers)
+        response.raise_for_status()
+        codes.extend(item["short_code"] for item in response.json()["results"])
+    return codes
+
+async def login(client: httpx.AsyncClient, username: str) -> dict:
+    """Регистрирует пользователя и возвращает заголовок авторизации."""
+    await client.post("/auth/register", json={"username": username, "password": username})
+    response = await client.post("/auth/login", data={"username": username, "password": username})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+async def scenario_cold(client, args, rng) -> dict:
+    codes = await create_links(client, args.links, f"cold-{rng.random()}")
+    recorder = Recorder()
+    start = time.perf_counter()
+    await run_concurrently(
+        (recorder.request(client, "redirect", "GET", f"/links/{code}", (302,)) for code in codes),
+        args.concurrency
+    )
+    return recorder.report(time.perf_counter() - start)
+
+async def scenario_warm(client, args, rng) -> dict:
+    codes = await create_links(client, args.links, f"warm-{rng.random()}")
+    # Прогрев: каждый код один раз попадает в Redis и L1
+    await run_concurrently((client.get(f"/links/{code}") for code in codes), args.concurrency)
+    sample = ZipfSampler(len(codes), args.zipf, rng)
+    recorder = Recorder()
+    start = time.perf_counter()
+    await run_concurrently(
+        (
+            recorder.request(client, "redirect", "GET", f"/links/{codes[sample()]}", (302,))
+            for _ in range(args.requests)
+        ),
+        args.concurrency
+    )
+    return recorder.report(time.perf_counter() - start)
+
+async def scenario_mixed(client, args, rng) -> dict:
+    headers = await login(client, f"bench{rng.randrange(10 ** 9)}")
+    codes = await create_links(client, args.links, f"mixed-{rng.random()}")
+    owned = await create_links(client, max(args.links // 10, 10), f"owned-{rng.random()}", headers)
+    sample = ZipfSampler(len(codes), args.zipf, rng)
+    recorder = Recorder()
+
+    def job(i: int):
+        operation = weighted_choice(MIXED_WEIGHTS, rng)
+        if operation == "redirect":
+            return recorder.request(client, operation, "GET", f"/links/{codes[sample()]}", (302,))
+        if operation == "stats":
+            return recorder.request(client, operation, "GET", f"/links/{codes[sample()]}/stats", (200,))
+        if operation == "create" or not owned:
+            return create_owned(i)
+        if operation == "update":
+            # 404 возможен, если параллельный запрос уже удалил эту ссылку
+            return recorder.request(
+                client, operation, "PUT", f"/links/{rng.choice(owned)}",
+                (200, 404), params={"original_url": f"https://bench.example.com/updated/{i}"}, headers=headers
+            )
+        return delete_owned()
+
+    async def create_owned(i: int):
+        response = await recorder.request(
+            client, "create", "POST", "/links/shorten", (201,),
+            json={"original_url": f"https://bench.example.com/new/{i}"}, headers=headers
+        )
+        if response is not None and response.status_code == 201:
+            owned.append(response.json()["short_code"])
+
+    async def delete_owned():
+        short_code = owned.pop(rng.randrange(len(owned)))
+        await recorder.request(client, "delete", "DELETE", f"/links/{short_code}", (200,), headers=headers)
+
+    start = time.perf_counter()
+    await run_concurrently((job(i) for i in range(args.requests)), args.concurrency)
+    return recorder.report(time.perf_counter() - start)
+
+SCENARIOS = {
+    "cold": scenario_cold,
+    "warm": scenario_warm,
+    "mixed": scenario_mixed,
+}
+
+async def main(args):
+    rng = random.Random(args.seed)
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    for name in scenarios:
+        if name not in SCENARIOS:
+            raise SystemExit(f"Неизвестный сценарий: {name}")
+
+    report = {
+        "started_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "target": args.base_url or "in-process",
+        "redis": None if args.base_url else args.redis,
+        "config": {
+            "links": args.links,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "zipf": args.zipf,
+            "seed": args.seed
+        },
+        "scenarios": {}
+    }
+
+    if args.base_url:
+        async with httpx.AsyncClient(base_url=args.base_url, timeout=30) as client:
+            for name in scenarios:
+                report["scenarios"][name] = await SCENARIOS[name](client, args, rng)
+    else:
+        # Импортируем после настройки окружения: src.config читает его при импорте
+        import redis.asyncio as redis
+        import src.cache as cache
+        from main import app
+
+        if args.redis == "fake":
+            from fakeredis import FakeServer
+            from fakeredis.aioredis import FakeConnection
+            server = FakeServer()
+            cache.redis_pool = redis.ConnectionPool(connection_class=FakeConnection, server=server, decode_responses=True)
+            cache.binary_redis_pool = redis.ConnectionPool(connection_class=FakeConnection, server=server)
+
+        transport = httpx.ASGITransport(app=app)
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=30) as client:
+                for name in scenarios:
+                    report["scenarios"][name] = await SCENARIOS[name](client, args, rng)
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not args.base_url:
+        os.environ["DATABASE_URL"] = args.url or f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench_load.db"
+        os.environ.setdefault("REDIS_HOST", "localhost")
+        os.environ.setdefault("REDIS_PORT", "6379")
+        os.environ.setdefault("JWT_SECRET_KEY", "bench")
+        os.environ.setdefault("SHORT_CODE_SECRET", "bench")
+        os.environ.setdefault("JWT_ALGORITHM", "HS256")
+        os.environ.setdefault("BCRYPT_ROUNDS", "4")
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+        if args.redis == "fake":
+            # fakeredis копирует всю битовую карту на каждый SETBIT; на 8 МБ фильтре это
+            # десятки мс на создание ссылки, которых нет в настоящем Redis
+            os.environ.setdefault("BLOOM_FILTER_BITS", str(2 ** 16))
+    asyncio.run(main(args))
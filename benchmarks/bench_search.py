@@ -0,0 +1,128 @@
+"""Бенчмарк поиска ссылки по original_url до и после миграции индексов.
+
+Заполняет таблицу links старой схемы (без original_url_hash и индексов),
+замеряет прежний запрос WHERE original_url = ? AND user_id = ?, применяет
+миграции и замеряет search_link_by_original_url.
+
+Запуск: python -m benchmarks.bench_search --rows 1000000
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+OLD_SCHEMA = [
+    """CREATE TABLE users (
+        id INTEGER PRIMARY KEY,
+        username VARCHAR UNIQUE,
+        hashed_password VARCHAR,
+        email VARCHAR UNIQUE,
+        created_at TIMESTAMP
+    )""",
+    """CREATE TABLE links (
+        id INTEGER PRIMARY KEY,
+        short_code VARCHAR UNIQUE,
+        original_url VARCHAR,
+        created_at TIMESTAMP,
+        expires_at TIMESTAMP,
+        user_id INTEGER REFERENCES users (id)
+    )""",
+]
+INSERT_CHUNK = 50000
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--url", help="URL базы (по умолчанию временный файл SQLite)")
+    return parser.parse_args()
+
+def summary(samples):
+    samples = sorted(samples)
+    return {
+        "mean_ms": round(statistics.mean(samples) * 1000, 3),
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 3),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1] * 1000, 3)
+    }
+
+async def main(args):
+    # Импортируем после настройки окружения: src.config читает его при импорте
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import AsyncSession
+    import src.database as database
+    from src.links import search_link_by_original_url
+    from src.migrations import run_migrations
+
+    engine = database.create_engine_for_url(database.DATABASE_URL)
+    async with engine.begin() as conn:
+        for ddl in OLD_SCHEMA:
+            await conn.execute(text(ddl))
+        await conn.execute(text("INSERT INTO users (id, username) VALUES (:id, :name)"), [
+            {"id": i, "name": f"user{i}"} for i in range(1, args.users + 1)
+        ])
+
+    start = time.perf_counter()
+    now = datetime.utcnow()
+    for offset in range(0, args.rows, INSERT_CHUNK):
+        async with engine.begin() as conn:
+            await conn.execute(
+                text("INSERT INTO links (short_code, original_url, created_at, user_id) VALUES (:code, :url, :created_at, :user_id)"),
+                [
+                    {
+                        "code": f"c{i}",
+                        "url": f"https://example.com/page/{i}",
+                        "created_at": now,
+                        "user_id": i % args.users + 1
+                    }
+                    for i in range(offset, min(offset + INSERT_CHUNK, args.rows))
+                ]
+            )
+    print(f"Заполнено {args.rows} ссылок за {time.perf_counter() - start:.1f} c")
+
+    targets = [random.randrange(args.rows) for _ in range(args.queries)]
+
+    before = []
+    async with engine.connect() as conn:
+        for i in targets:
+            start = time.perf_counter()
+            result = await conn.execute(
+                text("SELECT * FROM links WHERE original_url = :url AND user_id = :user_id"),
+                {"url": f"https://example.com/page/{i}", "user_id": i % args.users + 1}
+            )
+            assert result.first() is not None
+            before.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await run_migrations(engine)
+    print(f"Миграции (с заполнением original_url_hash) заняли {time.perf_counter() - start:.1f} c")
+
+    after = []
+    async with AsyncSession(engine) as db:
+        for i in targets:
+            start = time.perf_counter()
+            await search_link_by_original_url(
+                original_url=f"https://example.com/page/{i}",
+                db=db,
+                user_id=i % args.users + 1
+            )
+            after.append(time.perf_counter() - start)
+    await engine.dispose()
+
+    print(f"До миграции:    {summary(before)}")
+    print(f"После миграции: {summary(after)}")
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.url:
+        os.environ["DATABASE_URL"] = args.url
+    else:
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench_search.db"
+    os.environ.setdefault("REDIS_HOST", "localhost")
+    os.environ.setdefault("REDIS_PORT", "6379")
+    os.environ.setdefault("SHORT_CODE_SECRET", "bench")
+    asyncio.run(main(args))
@@ -0,0 +1,55 @@
+"""Общие части нагрузочных сценариев: Zipf-выбор ссылок и сводка задержек.
+
+Используется и locustfile.py, и benchmarks/bench_load.py, чтобы оба
+генерировали одинаковое распределение трафика.
+"""
+import bisect
+import itertools
+import math
+import random
+
+# Доли операций смешанного сценария (чтение/запись примерно 9:1)
+MIXED_WEIGHTS = {
+    "redirect": 80,
+    "stats": 10,
+    "create": 5,
+    "update": 3,
+    "delete": 2,
+}
+
+class ZipfSampler:
+    """Выбирает индекс 0..n-1 с вероятностью, пропорциональной 1 / (rank + 1) ** s.
+
+    Несколько "горячих" ссылок получают большую часть переходов, как в
+    реальном трафике сокращателя.
+    """
+
+    def __init__(self, n: int, s: float = 1.1, rng: random.Random | None = None):
+        self.rng = rng or random.Random()
+        self.cum_weights = list(itertools.accumulate(1 / (rank + 1) ** s for rank in range(n)))
+
+    def __call__(self) -> int:
+        return bisect.bisect_left(self.cum_weights, self.rng.random() * self.cum_weights[-1])
+
+def weighted_choice(weights: dict[str, int], rng: random.Random) -> str:
+    """Выбирает ключ словаря с вероятностью, пропорциональной весу."""
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+def percentile(sorted_samples: list[float], q: float) -> float:
+    """Перцентиль по методу ближайшего ранга (q от 0 до 1)."""
+    if not sorted_samples:
+        return 0.0
+    rank = max(1, math.ceil(q * len(sorted_samples)))
+    return sorted_samples[rank - 1]
+
+def latency_summary(samples: list[float], errors: int, duration: float) -> dict:
+    """Сводка по операции: число запросов, ошибки, p50/p95/p99 в мс и пропускная способность."""
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "errors": errors,
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 3),
+        "throughput_rps": round(len(samples) / duration, 1) if duration > 0 else 0.0
+    }
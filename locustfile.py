@@ -1,26 +1,139 @@
-from locust import HttpUser, task, between
-from datetime import datetime, timedelta
-import time
-
-class QuickstartUser(HttpUser):
-    wait_time = between(1, 2)
-
-    @task
-    def get_root(self):
-        self.client.get("/docs") 
-
-    @task
-    def create_short_link(self):
-        unique_id = str(time.time()).replace('.', '') 
-        expires_at_datetime = datetime.utcnow() + timedelta(minutes=10)
-        expires_at_str = expires_at_datetime.isoformat()
-        data = {
-            "original_url": f"https://mail.ru/{unique_id}", 
-            "custom_alias": f"short_{unique_id}", 
-            "expires_at": expires_at_str
+"""Нагрузочный сценарий Locust: Zipf-редиректы, /stats, пакетное разрешение и запись.
+
+Перед стартом создается набор ссылок (LOCUST_LINKS), с LOCUST_SCENARIO=warm
+каждая из них один раз запрашивается, чтобы прогреть кэш. Читатели и
+писатели соотносятся примерно как 9:1. По завершении отчет с p50/p95/p99 и
+RPS по каждому запросу пишется в LOCUST_REPORT.
+
+Запуск без UI:
+    locust -f locustfile.py --headless -u 100 -r 20 -t 1m --host http://localhost:8000
+"""
+import json
+import os
+import random
+import uuid
+from datetime import datetime
+
+import requests
+from locust import HttpUser, between, events, task
+
+from benchmarks.workload import ZipfSampler
+
+LINKS = int(os.getenv("LOCUST_LINKS", 1000))
+SCENARIO = os.getenv("LOCUST_SCENARIO", "warm")
+ZIPF_S = float(os.getenv("LOCUST_ZIPF", 1.1))
+REPORT = os.getenv("LOCUST_REPORT", "locust_report.json")
+RESOLVE_BATCH = 20
+
+codes = []
+sample = None
+
+@events.test_start.add_listener
+def create_links(environment, **kwargs):
+    """Создает общий набор ссылок и при warm прогревает кэш."""
+    global sample
+    tag = uuid.uuid4().hex
+    session = requests.Session()
+    for offset in range(0, LINKS, 1000):
+        batch = [
+            {"original_url": f"https://load.example.com/{tag}/{i}"}
+            for i in range(offset, min(offset + 1000, LINKS))
+        ]
+        response = session.post(f"{environment.host}/links/shorten/batch", json=batch)
+        response.raise_for_status()
+        codes.extend(item["short_code"] for item in response.json()["results"])
+    if SCENARIO == "warm":
+        for code in codes:
+            session.get(f"{environment.host}/links/{code}", allow_redirects=False)
+    sample = ZipfSampler(len(codes), ZIPF_S, random.Random())
+
+@events.test_stop.add_listener
+def write_report(environment, **kwargs):
+    """Сохраняет перцентили задержек и пропускную способность в JSON."""
+    stats = environment.stats
+
+    def summary(entry):
+        return {
+            "count": entry.num_requests,
+            "failures": entry.num_failures,
+            "p50_ms": entry.get_response_time_percentile(0.50),
+            "p95_ms": entry.get_response_time_percentile(0.95),
+            "p99_ms": entry.get_response_time_percentile(0.99),
+            "throughput_rps": round(entry.total_rps, 1)
         }
-        self.client.post(
-            "links/shorten",
-            json=data,
-            headers={"Content-Type": "application/json"}
-        )
\ No newline at end of file
+
+    report = {
+        "finished_at": datetime.utcnow().isoformat(),
+        "host": environment.host,
+        "scenario": SCENARIO,
+        "links": LINKS,
+        "zipf": ZIPF_S,
+        "total": summary(stats.total),
+        "requests": {f"{method} {name}": summary(entry) for (name, method), entry in stats.entries.items()}
+    }
+    with open(REPORT, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+class Reader(HttpUser):
+    """Анонимный трафик: переходы по горячим ссылкам, статистика и промахи."""
+    weight = 9
+    wait_time = between(0.01, 0.1)
+
+    def hot_code(self):
+        return codes[sample()]
+
+    @task(80)
+    def redirect(self):
+        self.client.get(f"/links/{self.hot_code()}", allow_redirects=False, name="/links/[code]")
+
+    @task(10)
+    def stats(self):
+        self.client.get(f"/links/{self.hot_code()}/stats", name="/links/[code]/stats")
+
+    @task(5)
+    def resolve(self):
+        self.client.post("/links/resolve", json={"short_codes": [self.hot_code() for _ in range(RESOLVE_BATCH)]})
+
+    @task(5)
+    def missing(self):
+        with self.client.get(
+            f"/links/missing{random.randrange(10 ** 9)}", allow_redirects=False,
+            name="/links/[missing]", catch_response=True
+        ) as response:
+            if response.status_code == 404:
+                response.success()
+
+class Writer(HttpUser):
+    """Авторизованный пользователь: создает, изменяет и удаляет свои ссылки."""
+    weight = 1
+    wait_time = between(0.1, 0.5)
+
+    def on_start(self):
+        username = f"load_{uuid.uuid4().hex[:12]}"
+        self.client.post("/auth/register", json={"username": username, "password": username})
+        response = self.client.post("/auth/login", data={"username": username, "password": username})
+        self.client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+        self.owned = []
+
+    @task(5)
+    def create(self):
+        response = self.client.post(
+            "/links/shorten",
+            json={"original_url": f"https://load.example.com/new/{uuid.uuid4().hex}"}
+        )
+        if response.status_code == 201:
+            self.owned.append(response.json()["short_code"])
+
+    @task(3)
+    def update(self):
+        if self.owned:
+            self.client.put(
+                f"/links/{random.choice(self.owned)}",
+                params={"original_url": f"https://load.example.com/updated/{uuid.uuid4().hex}"},
+                name="/links/[code]"
+            )
+
+    @task(2)
+    def delete(self):
+        if self.owned:
+            self.client.delete(f"/links/{self.owned.pop(random.randrange(len(self.owned)))}", name="/links/[code]")
@@ -1,18 +1,46 @@
 from fastapi import FastAPI
 from src.routers.auth_router import router as auth_router
 from src.routers.links_router import router as links_router
+from src.routers.metrics_router import router as metrics_router
 import src.database as database
+import src.migrations as migrations
+import src.cache as cache
+from src.clicks import click_writer
+from src.sweeper import create_scheduler
+from src.hashing import password_hasher
+from src.fast_path import RedirectFastPathMiddleware, static_get_paths
+from src.config import REDIRECT_FAST_PATH
+from src.logs import setup_logging, get_logger
+from src.metrics import MetricsMiddleware, monitor_event_loop_lag
 import uvicorn
+import asyncio
 from contextlib import asynccontextmanager
 from starlette.middleware.cors import CORSMiddleware
 
 
+logger = get_logger("app")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print("Приложение запускается...")
+    log_listener = setup_logging() # Пишем логи из отдельного потока, не блокируя event loop
+    logger.info("Приложение запускается...")
     await database.create_database() # Создаем таблицы при запуске
+    await migrations.run_migrations() # Обновляем схему существующей базы
+    await cache.open_redis() # Общий клиент Redis на процесс
+    invalidation_task = asyncio.create_task(cache.listen_invalidations())
+    loop_lag_task = asyncio.create_task(monitor_event_loop_lag())
+    click_writer.start()
+    scheduler = create_scheduler()
+    scheduler.start() # Периодически удаляем истекшие ссылки
     yield
-    print("Приложение завершает работу...")
+    logger.info("Приложение завершает работу...")
+    scheduler.shutdown(wait=False)
+    invalidation_task.cancel()
+    loop_lag_task.cancel()
+    await click_writer.stop() # Дописываем клики, оставшиеся в очереди
+    await cache.close_redis()
+    password_hasher.shutdown()
+    log_listener.stop() # Дописывает оставшиеся в очереди записи
 
 origins = ["*"]
 
@@ -27,9 +55,18 @@ def create_app():
     allow_headers=["*"],
     expose_headers=["*"]
     )
+    if REDIRECT_FAST_PATH:
+        # Добавлено последним - значит, выполняется первым, до CORS и роутинга
+        app.add_middleware(
+            RedirectFastPathMiddleware,
+            prefix=links_router.prefix,
+            reserved=static_get_paths(links_router)
+        )
+    app.add_middleware(MetricsMiddleware) # Самый внешний: замеряет и быстрый путь редиректа
 
     app.include_router(auth_router)
     app.include_router(links_router)
+    app.include_router(metrics_router)
 
     return app
 
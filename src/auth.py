@@ -3,16 +3,28 @@ from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from src.database import get_db, User
-import bcrypt
+from src.hashing import password_hasher
 from datetime import datetime, timedelta
 from src.models import UserCreate
-from src.config import JWT_ALGORITHM, JWT_SECRET_KEY
+from src.config import JWT_ALGORITHM, JWT_SECRET_KEY, JWT_STATELESS, USER_CACHE_MAXSIZE, USER_CACHE_TTL
+from src.cache import get_redis, LocalCache
 from jose import jwt, JWTError
-from typing import Optional
+from typing import NamedTuple, Optional
+import redis.asyncio as redis
+from src.logs import get_logger
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="auth/login", auto_error=False)
 
+TOKEN_VERSION_PREFIX = "user:token_version:"
+logger = get_logger("auth")
+user_cache = LocalCache(maxsize=USER_CACHE_MAXSIZE, ttl=USER_CACHE_TTL) # пользователи по subject токена
+
+class CurrentUser(NamedTuple):
+    """Пользователь запроса. В отличие от ORM User не привязан к сессии, поэтому его можно кэшировать."""
+    id: int
+    username: str
+
 async def create_user(
         user: UserCreate,
         db: AsyncSession = Depends(get_db)
@@ -26,10 +38,7 @@ async def create_user(
             detail= "Username already registered"
         )
     
-    hashed_password = bcrypt.hashpw(
-        user.password.encode('utf-8'),
-        bcrypt.gensalt()
-    )
+    hashed_password = await password_hasher.hash(user.password)
 
     db_user = User(
         username= user.username,
@@ -55,26 +64,85 @@ async def authenticate_user(
     user = result.scalar_one_or_none()
 
     if not user:
-        print(f'{username} не найден')
+        logger.info("Пользователь не найден", extra={"username": username})
         raise HTTPException(
             status_code= status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials"
         )
     
-    if not bcrypt.checkpw(
-        password.encode("utf-8"),
-        user.hashed_password
-    ):
-        print(f'{username} не найден')
+    if not await password_hasher.verify(password, user.hashed_password):
+        logger.info("Неверный пароль", extra={"username": username})
         raise HTTPException(
             status_code= status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials"
         )
     return user
     
+async def get_token_version(
+        user_id: int,
+        redis_client: redis.Redis
+        ) -> int:
+    """Возвращает текущую версию токенов пользователя (0, если токены не отзывались)."""
+    version = await redis_client.get(f"{TOKEN_VERSION_PREFIX}{user_id}")
+    return int(version or 0)
+
+async def revoke_user_tokens(
+        user_id: int,
+        redis_client: redis.Redis
+        ) -> int:
+    """Отзывает все выданные пользователю токены, увеличивая версию токенов."""
+    return await redis_client.incr(f"{TOKEN_VERSION_PREFIX}{user_id}")
+
+async def get_user_from_token(
+        token: str,
+        db: AsyncSession,
+        redis_client: redis.Redis
+        ) -> Optional[CurrentUser]:
+    """Проверяет JWT и возвращает пользователя или None.
+
+    Для токенов с uid в штатном случае не нужен ни один SQL запрос:
+    отзыв проверяется по версии токенов в Redis, а пользователь берется
+    из TTL кэша по subject.
+    """
+    try:
+        payload = jwt.decode(
+            token,
+            JWT_SECRET_KEY,
+            algorithms= [JWT_ALGORITHM]
+        )
+    except JWTError:
+        return None
+    username: str = payload.get('sub')
+    if username is None:
+        return None
+    user_id = payload.get("uid")
+
+    user = user_cache.get(username) if JWT_STATELESS and user_id is not None else None
+    if user is not None and user.id != user_id:
+        # Имя могли освободить и зарегистрировать заново: снимок принадлежит другому пользователю
+        user = None
+    if user is None:
+        if user_id is not None:
+            result = await db.execute(select(User).where(User.id == user_id))
+        else:
+            # Токены, выданные до появления uid в claims
+            result = await db.execute(select(User).where(User.username == username))
+        db_user = result.scalar_one_or_none()
+        if db_user is None or db_user.username != username:
+            return None
+        # Экземпляр ORM принадлежит сессии запроса: после ее отката или закрытия он непригоден
+        user = CurrentUser(db_user.id, db_user.username)
+        if JWT_STATELESS:
+            user_cache.set(username, user)
+
+    if payload.get("ver", 0) != await get_token_version(user.id, redis_client):
+        return None
+    return user
+
 async def get_current_user(
         token: str = Depends(oauth2_scheme),
-        db: AsyncSession = Depends(get_db)
+        db: AsyncSession = Depends(get_db),
+        redis_client: redis.Redis = Depends(get_redis)
 ):
     """Получает текущего пользователя из JWT токена."""
     credentials_exception = HTTPException(
@@ -82,28 +150,21 @@ async def get_current_user(
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(
-            token,
-            JWT_SECRET_KEY,
-            algorithms= [JWT_ALGORITHM]
-        )
-        username: str = payload.get('sub')
-        if username is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    result = await db.execute(select(User).where(User.username == username))
-    print(result)
-    user = result.scalar_one_or_none()
+    user = await get_user_from_token(token, db, redis_client)
     if user is None:
         raise credentials_exception
     return user
 
-def create_jwt_token(username: str):
+def create_jwt_token(
+        username: str,
+        user_id: int | None = None,
+        token_version: int = 0
+        ):
     """Создает JWT токен для аутентифицированного пользователя."""
     payload = {
         "sub": username, 
+        "uid": user_id,
+        "ver": token_version,
         "exp": datetime.utcnow() + timedelta(minutes=30)
     }
     token = jwt.encode(payload, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
@@ -111,19 +172,12 @@ def create_jwt_token(username: str):
 
 async def get_current_user_optional(
         token: Optional[str] = Depends(oauth2_scheme_optional), 
-        db: AsyncSession = Depends(get_db)
-        ) -> Optional[User]:
+        db: AsyncSession = Depends(get_db),
+        redis_client: redis.Redis = Depends(get_redis)
+        ) -> Optional[CurrentUser]:
      if token is None:
          return None
      try:
-         payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
-         username: str = payload.get("sub")
-         if username is None:
-              return None 
-         result = await db.execute(select(User).where(User.username == username))
-         user = result.scalar_one_or_none()
-         return user
-     except JWTError:
-         return None # Токен невалиден
-     except Exception: # Обработка других возможных ошибок
+         return await get_user_from_token(token, db, redis_client)
+     except (JWTError, HTTPException): # Ошибки Redis и БД не должны превращать запрос в анонимный
          return None
\ No newline at end of file
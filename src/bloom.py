@@ -0,0 +1,117 @@
+from sqlalchemy import select
+from src.database import Link
+from src.config import BLOOM_FILTER_BITS, BLOOM_FILTER_HASHES, NEGATIVE_CACHE_TTL
+from src.cache import NEGATIVE_CACHE_PREFIX
+import src.database as database
+import src.cache as cache
+import redis.asyncio as redis
+import hashlib
+
+BUILD_CHUNK = 10000
+
+class RedisBloomFilter:
+    """Bloom-фильтр существующих коротких кодов в битовой карте Redis.
+
+    Фильтр общий для всех воркеров, поэтому ссылка, созданная на одном
+    воркере, сразу видна остальным. Пока фильтр не построен (нет ключа
+    ready), он считает любой код возможно существующим.
+    """
+
+    def __init__(
+            self,
+            key: str = "bloom:short_codes",
+            size: int = BLOOM_FILTER_BITS,
+            hashes: int = BLOOM_FILTER_HASHES
+            ):
+        self.key = key
+        self.ready_key = f"{key}:ready"
+        self.size = size
+        self.hashes = hashes
+
+    def offsets(self, item: str) -> list[int]:
+        """Позиции битов элемента (двойное хеширование одного blake2b)."""
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add_to_pipeline(self, pipe, item: str):
+        """Добавляет установку битов элемента в пайплайн."""
+        for offset in self.offsets(item):
+            pipe.setbit(self.key, offset, 1)
+
+    async def build(self):
+        """Заполняет фильтр всеми короткими кодами из БД, если он еще не построен."""
+        client = cache.get_client()
+        if await client.exists(self.ready_key):
+            return False
+        # Строит один воркер; остальные продолжают работать без фильтра
+        if not await client.set(f"{self.key}:building", 1, nx=True, ex=600):
+            return False
+        try:
+            last_id = 0
+            while True:
+                async with database.async_session() as db:
+                    result = await db.execute(
+                        select(Link.id, Link.short_code)
+                        .where(Link.id > last_id)
+                        .order_by(Link.id)
+                        .limit(BUILD_CHUNK)
+                    )
+                    rows = result.all()
+                if not rows:
+                    break
+                async with client.pipeline(transaction=False) as pipe:
+                    for _, short_code in rows:
+                        self.add_to_pipeline(pipe, short_code)
+                    await pipe.execute()
+                last_id = rows[-1][0]
+            await client.set(self.ready_key, 1)
+        finally:
+            await client.delete(f"{self.key}:building")
+        return True
+
+short_code_filter = RedisBloomFilter()
+
+
+async def register_short_codes(
+        short_codes: list[str],
+        redis_client: redis.Redis
+        ):
+    """Добавляет новые коды в Bloom-фильтр и снимает с них негативный кэш."""
+    if not short_codes:
+        return
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for short_code in short_codes:
+            short_code_filter.add_to_pipeline(pipe, short_code)
+        pipe.delete(*[f"{NEGATIVE_CACHE_PREFIX}{short_code}" for short_code in short_codes])
+        await pipe.execute()
+
+
+async def is_known_absent(
+        short_code: str,
+        redis_client: redis.Redis
+        ) -> bool:
+    """Проверяет негативный кэш и Bloom-фильтр за один запрос к Redis."""
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.exists(f"{NEGATIVE_CACHE_PREFIX}{short_code}")
+        pipe.exists(short_code_filter.ready_key)
+        for offset in short_code_filter.offsets(short_code):
+            pipe.getbit(short_code_filter.key, offset)
+        negative, ready, *bits = await pipe.execute()
+    if negative:
+        return True
+    return bool(ready) and not all(bits)
+
+
+async def remember_absent(
+        short_code: str,
+        redis_client: redis.Redis
+        ):
+    """Запоминает отсутствующий код на NEGATIVE_CACHE_TTL секунд."""
+    await cache.set_cache(
+        f"{NEGATIVE_CACHE_PREFIX}{short_code}",
+        "1",
+        expire=NEGATIVE_CACHE_TTL,
+        redis_client=redis_client
+        )
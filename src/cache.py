@@ -1,12 +1,309 @@
-from src.config import REDIS_HOST, REDIS_PORT
+from src.config import REDIS_HOST, REDIS_PORT, L1_CACHE_MAXSIZE, L1_CACHE_TTL, CACHE_INVALIDATION_CHANNEL
+from src.config import CACHE_EARLY_REFRESH_DELTA, CACHE_EARLY_REFRESH_BETA
+from src.config import REDIS_MAX_CONNECTIONS, REDIS_POOL_TIMEOUT, REDIS_SOCKET_TIMEOUT, REDIS_CONNECT_TIMEOUT
+from src.config import REDIS_HEALTH_CHECK_INTERVAL, REDIS_RETRY_ATTEMPTS, REDIS_RETRY_BACKOFF_BASE, REDIS_RETRY_BACKOFF_CAP
+from src.metrics import cache_requests, cache_operation_duration, key_prefix
+from src.logs import get_logger
 import redis.asyncio as redis
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialBackoff
+from redis.utils import HIREDIS_AVAILABLE
+import asyncio
+import math
+import random
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime
 
-redis_pool = redis.ConnectionPool(host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=True)
+logger = get_logger("cache")
+
+def create_redis_pool(decode_responses: bool = True) -> redis.ConnectionPool:
+    """Пул с ограничением числа соединений, таймаутами, проверкой соединений и повторами.
+
+    Повторяются только ошибки соединения: после таймаута чтения команда
+    (INCRBY, HINCRBY) могла уже выполниться. По умолчанию Retry повторяет
+    и TimeoutError, а retry_on_error лишь дополняет этот список, поэтому
+    набор ошибок задается в самом Retry. Парсер hiredis redis-py
+    подключает сам, если пакет установлен.
+    """
+    return redis.BlockingConnectionPool(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        db=0,
+        decode_responses=decode_responses,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+        socket_keepalive=True,
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+        retry=Retry(
+            ExponentialBackoff(cap=REDIS_RETRY_BACKOFF_CAP, base=REDIS_RETRY_BACKOFF_BASE),
+            REDIS_RETRY_ATTEMPTS,
+            supported_errors=(redis.ConnectionError,)
+        )
+    )
+
+redis_pool = create_redis_pool()
+# Для бинарных значений (msgpack записи ссылок в link:)
+binary_redis_pool = create_redis_pool(decode_responses=False)
+
+# Общие клиенты воркера: создаются в lifespan (open_redis), вне приложения - при первом обращении
+redis_client: redis.Redis | None = None
+binary_redis_client: redis.Redis | None = None
+
+LINK_CACHE_PREFIX = "link:"
+LINK_CACHE_TTL = 3600
+NEGATIVE_CACHE_PREFIX = "neg:"
+
+def link_cache_ttl(expires_at: datetime | None, ttl: int) -> int:
+    """Ограничивает TTL ключа ссылки оставшимся временем жизни самой ссылки."""
+    if expires_at is None:
+        return ttl
+    remaining = int((expires_at - datetime.utcnow()).total_seconds())
+    return max(1, min(ttl, remaining))
+
+class LocalCache:
+    """In-process LRU кэш (L1) с ограничением размера и TTL на каждую запись."""
+
+    def __init__(
+            self, 
+            maxsize: int = L1_CACHE_MAXSIZE, 
+            ttl: int = L1_CACHE_TTL
+            ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key: str):
+        """Возвращает значение по ключу или None, если его нет или оно истекло."""
+        return self.get_with_ttl(key)[0]
+
+    def get_with_ttl(self, key: str):
+        """Возвращает значение и оставшийся TTL источника (ключа в Redis), если он был передан в set."""
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None, None
+        value, expires_at, source_expires_at = item
+        now = time.monotonic()
+        if expires_at <= now:
+            del self._data[key]
+            self.misses += 1
+            return None, None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value, None if source_expires_at is None else source_expires_at - now
+
+    def set(self, key: str, value, ttl: float | None = None, source_ttl: float | None = None):
+        """Сохраняет значение. TTL не может превышать TTL кэша по умолчанию.
+
+        source_ttl - оставшееся время жизни того же значения в Redis: по нему
+        раннее обновление работает и при попаданиях в L1.
+        """
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            self._data.pop(key, None)
+            return
+        now = time.monotonic()
+        self._data[key] = (value, now + ttl, None if source_ttl is None else now + source_ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        """Удаляет ключ из кэша."""
+        self._data.pop(key, None)
+
+    def clear(self):
+        """Очищает кэш."""
+        self._data.clear()
+
+    def stats(self):
+        """Возвращает размер кэша и счетчики попаданий/промахов."""
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+local_cache = LocalCache()
+
+class SingleFlight:
+    """Склеивает параллельные загрузки одного ключа внутри воркера.
+
+    Первый запрос по ключу выполняет загрузку, остальные ждут ее результат
+    (или исключение) вместо того, чтобы повторять тот же запрос к БД.
+    """
+
+    def __init__(self):
+        self.loads = 0
+        self.coalesced = 0
+        self._inflight = {}
+
+    async def do(self, key: str, loader):
+        """Возвращает результат loader() для ключа, выполняя не больше одной загрузки одновременно."""
+        while (future := self._inflight.get(key)) is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise # отменили сам ожидающий запрос
+                # Загружавший запрос отменили - загружаем сами
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        self.loads += 1
+        try:
+            result = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception() # без ожидающих исключение не должно попасть в лог asyncio
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._inflight[key]
+
+    def stats(self):
+        """Возвращает число загрузок и присоединившихся к ним запросов."""
+        return {
+            "inflight": len(self._inflight),
+            "loads": self.loads,
+            "coalesced": self.coalesced
+        }
+
+link_loads = SingleFlight()
+
+def should_refresh_early(
+        ttl: float, 
+        delta: float = CACHE_EARLY_REFRESH_DELTA, 
+        beta: float = CACHE_EARLY_REFRESH_BETA
+        ) -> bool:
+    """Вероятностное раннее обновление (XFetch): чем ближе истечение ключа, тем выше шанс.
+
+    delta - примерное время пересчета значения, beta > 1 обновляет раньше.
+    """
+    if ttl is None or ttl < 0 or delta <= 0 or beta <= 0:
+        return False
+    return delta * beta * -math.log(1.0 - random.random()) >= ttl
+
+@contextmanager
+def measure_cache(operation: str, key: str):
+    """Замеряет команду Redis и считает ее ошибки по префиксу ключа."""
+    prefix = key_prefix(key)
+    try:
+        with cache_operation_duration.time(operation=operation, prefix=prefix):
+            yield prefix
+    except redis.RedisError:
+        cache_requests.inc(tier="redis", prefix=prefix, result="error")
+        raise
+
+def get_client() -> redis.Redis:
+    """Общий клиент Redis воркера (ответы декодируются в str)."""
+    global redis_client
+    if redis_client is None:
+        redis_client = redis.Redis(connection_pool=redis_pool)
+    return redis_client
+
+def get_binary_client() -> redis.Redis:
+    """Общий клиент Redis воркера без декодирования ответов."""
+    global binary_redis_client
+    if binary_redis_client is None:
+        binary_redis_client = redis.Redis(connection_pool=binary_redis_pool)
+    return binary_redis_client
+
+async def open_redis():
+    """Создает общие клиенты и заранее открывает соединение; недоступный Redis не мешает старту."""
+    client = get_client()
+    get_binary_client()
+    try:
+        await client.ping()
+    except redis.RedisError as e:
+        logger.warning("Redis недоступен при старте", extra={"error": repr(e)})
+    logger.info("Клиенты Redis созданы", extra={
+        "max_connections": REDIS_MAX_CONNECTIONS,
+        "parser": "hiredis" if HIREDIS_AVAILABLE else "python"
+    })
+
+async def close_redis():
+    """Закрывает общие клиенты и все соединения пулов."""
+    global redis_client, binary_redis_client
+    for client in (redis_client, binary_redis_client):
+        if client is not None:
+            await client.aclose()
+    redis_client = binary_redis_client = None
+    await redis_pool.disconnect()
+    await binary_redis_pool.disconnect()
 
 async def get_redis():
-    """Возвращает асинхронное соединение Redis из пула."""
-    async with redis.Redis(connection_pool=redis_pool) as client:
-        yield client
+    """Зависимость FastAPI: общий клиент Redis."""
+    return get_client()
+
+async def get_binary_redis():
+    """Зависимость FastAPI: общий клиент Redis без декодирования ответов."""
+    return get_binary_client()
+
+class BatchResult:
+    """Результат части пайплайна; value заполняется после выполнения пайплайна."""
+    __slots__ = ("value",)
+
+    def __init__(self, value=None):
+        self.value = value
+
+class CacheBatch:
+    """Пайплайн, в который несколько помощников ставят свои команды.
+
+    add() ставит команды через queue(pipe) и возвращает BatchResult, в
+    который после execute() попадает parse(ответы этих команд).
+    """
+
+    def __init__(self, pipe):
+        self.pipe = pipe
+        self._parts = []
+
+    def add(self, queue, parse=None) -> BatchResult:
+        start = len(self.pipe)
+        queue(self.pipe)
+        result = BatchResult()
+        self._parts.append((start, len(self.pipe), parse, result))
+        return result
+
+    async def execute(self):
+        if not len(self.pipe):
+            return
+        responses = await self.pipe.execute()
+        for start, end, parse, result in self._parts:
+            part = responses[start:end]
+            result.value = parse(part) if parse else part
+
+@asynccontextmanager
+async def cache_pipeline(
+        redis_client: redis.Redis = None,
+        transaction: bool = False,
+        name: str = "batch:"
+        ):
+    """Собирает команды из блока в один запрос к Redis и выполняет его при выходе.
+
+        async with cache_pipeline(client) as batch:
+            record = queue_link_record(batch, code)
+            clicks = queue_click_stats(batch, code)
+        record.value, clicks.value
+    """
+    async with (redis_client or get_client()).pipeline(transaction=transaction) as pipe:
+        batch = CacheBatch(pipe)
+        yield batch
+        with measure_cache("pipeline", name):
+            await batch.execute()
 
 async def set_cache(
         key: str, 
@@ -15,15 +312,9 @@ async def set_cache(
         redis_client: redis.Redis = None
         ):
     """Устанавливает значение в кэш Redis."""
-    close_conn = False
-    if redis_client is None:
-         redis_client = redis.Redis(connection_pool=redis_pool)
-         close_conn = True
-    try:
-        await redis_client.set(key, value, ex=expire) 
-    finally:
-        if close_conn:
-            await redis_client.close()
+    redis_client = redis_client or get_client()
+    with measure_cache("set", key):
+        await redis_client.set(key, value, ex=expire)
 
 
 async def get_cache(
@@ -31,15 +322,40 @@ async def get_cache(
         redis_client: redis.Redis = None
         ):
     """Получает значение из кэша Redis."""
-    close_conn = False
-    if redis_client is None:
-         redis_client = redis.Redis(connection_pool=redis_pool)
-         close_conn = True
-    try:
-        return await redis_client.get(key)
-    finally:
-         if close_conn:
-            await redis_client.close()
+    redis_client = redis_client or get_client()
+    with measure_cache("get", key) as prefix:
+        value = await redis_client.get(key)
+    cache_requests.inc(tier="redis", prefix=prefix, result="hit" if value else "miss")
+    return value
+
+
+async def get_cache_with_ttl(
+        key: str, 
+        redis_client: redis.Redis = None
+        ):
+    """Получает значение и оставшийся TTL (в секундах) за один запрос к Redis."""
+    redis_client = redis_client or get_client()
+    with measure_cache("get_ttl", key) as prefix:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            value, ttl = await pipe.get(key).ttl(key).execute()
+    cache_requests.inc(tier="redis", prefix=prefix, result="hit" if value else "miss")
+    return value, ttl
+
+
+async def wait_for_cache(
+        keys: list[str], 
+        timeout: float, 
+        redis_client: redis.Redis,
+        interval: float = 0.02
+        ):
+    """Ждет, пока другой воркер заполнит один из ключей; возвращает значения или None по таймауту."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        await asyncio.sleep(interval)
+        values = await redis_client.mget(keys)
+        if any(values):
+            return values
+    return None
 
 
 async def delete_cache(
@@ -47,12 +363,32 @@ async def delete_cache(
         redis_client: redis.Redis = None
         ):
     """Удаляет значение из кэша Redis."""
-    close_conn = False
-    if redis_client is None:
-         redis_client = redis.Redis(connection_pool=redis_pool)
-         close_conn = True
-    try:
+    redis_client = redis_client or get_client()
+    with measure_cache("delete", key):
         await redis_client.delete(key)
-    finally:
-        if close_conn:
-            await redis_client.close()
\ No newline at end of file
+
+
+async def publish_invalidation(
+        key: str, 
+        redis_client: redis.Redis = None
+        ):
+    """Удаляет ключ из L1 кэша и рассылает инвалидацию всем воркерам."""
+    local_cache.delete(key)
+    await (redis_client or get_client()).publish(CACHE_INVALIDATION_CHANNEL, key)
+
+
+async def listen_invalidations():
+    """Слушает канал инвалидации и удаляет ключи из L1 кэша текущего воркера."""
+    while True:
+        try:
+            async with get_client().pubsub() as pubsub:
+                await pubsub.subscribe(CACHE_INVALIDATION_CHANNEL)
+                while True:
+                    # Ждем меньше socket_timeout: блокирующее чтение по нему оборвалось бы
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is not None and message["type"] == "message":
+                        local_cache.delete(message["data"])
+        except (redis.ConnectionError, redis.TimeoutError):
+            # Пока подписка не работала, инвалидации могли потеряться
+            local_cache.clear()
+            await asyncio.sleep(1)
@@ -0,0 +1,222 @@
+from sqlalchemy import insert
+from src.database import LinkStats
+from src.links import get_links_by_short_codes
+from src.config import CLICK_QUEUE_MAXSIZE, CLICK_BATCH_SIZE, CLICK_FLUSH_INTERVAL, CLICK_STATS_HOURS, CLICK_STATS_DAYS
+import src.database as database
+import src.cache as cache
+import redis.asyncio as redis
+from collections import Counter
+from datetime import datetime, timedelta
+import asyncio
+from src.logs import get_logger
+
+CLICK_COUNTER_PREFIX = "clicks:"
+HOUR_BUCKET_FORMAT = "%Y-%m-%dT%H"
+DAY_BUCKET_FORMAT = "%Y-%m-%d"
+BUCKET_TTL = 60 * 60 * 24 * 90 # Неактивные ряды удаляются через 90 дней
+
+logger = get_logger("clicks")
+
+class ClickWriter:
+    """Буферизует переходы по ссылкам и пишет их в link_stats пачками.
+
+    Редирект только кладет событие в ограниченную очередь; фоновая задача
+    сбрасывает накопленное одним executemany, когда набирается batch_size
+    событий или проходит flush_interval секунд. При переполнении очереди
+    события отбрасываются, чтобы не замедлять редиректы.
+    """
+
+    def __init__(
+            self,
+            maxsize: int = CLICK_QUEUE_MAXSIZE,
+            batch_size: int = CLICK_BATCH_SIZE,
+            flush_interval: float = CLICK_FLUSH_INTERVAL
+            ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self._pending = []
+        self._task = None
+        self._inflight = None
+        self._stopping = False
+
+    def record(
+            self,
+            short_code: str,
+            user_agent: str | None,
+            ip_address: str | None
+            ):
+        """Ставит переход в очередь, не блокируя обработку запроса."""
+        try:
+            self.queue.put_nowait((short_code, user_agent, ip_address, datetime.utcnow()))
+            self.enqueued += 1
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def start(self):
+        """Запускает фоновую запись."""
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает фоновую запись и сбрасывает все накопленные события."""
+        if self._task is not None:
+            # wait_for может проглотить отмену, если элемент очереди пришел одновременно с ней;
+            # флаг не дает циклу снова заснуть на пустой очереди
+            self._stopping = True
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._inflight is not None:
+            await self._inflight
+        while not self.queue.empty():
+            self._pending.append(self.queue.get_nowait())
+        while self._pending:
+            batch = self._pending[:self.batch_size]
+            self._pending = self._pending[self.batch_size:]
+            await self._write(batch)
+
+    def stats(self):
+        """Возвращает счетчики конвейера кликов."""
+        return {
+            "queued": self.queue.qsize(),
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "written": self.written,
+            "failed": self.failed
+        }
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while not self._stopping:
+            self._pending.append(await self.queue.get())
+            deadline = loop.time() + self.flush_interval
+            while len(self._pending) < self.batch_size and not self._stopping:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    self._pending.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            batch, self._pending = self._pending, []
+            # shield: остановка приложения не должна оборвать запись на середине
+            self._inflight = asyncio.ensure_future(self._write(batch))
+            await asyncio.shield(self._inflight)
+            self._inflight = None
+
+    async def _write(self, batch: list):
+        """Записывает пачку событий в link_stats одним запросом."""
+        try:
+            async with database.async_session() as db:
+                links = await get_links_by_short_codes(list({short_code for short_code, *_ in batch}), db)
+                link_ids = {short_code: db_link.id for short_code, db_link in links.items()}
+                rows = [
+                    {
+                        "link_id": link_ids[short_code],
+                        "user_agent": user_agent,
+                        "ip_address": ip_address,
+                        "created_at": created_at
+                    }
+                    for short_code, user_agent, ip_address, created_at in batch
+                    if short_code in link_ids
+                ]
+                if rows:
+                    await db.execute(insert(LinkStats), rows)
+                    await db.commit()
+                self.written += len(rows)
+        except Exception as e:
+            self.failed += len(batch)
+            logger.error("Не удалось записать клики", extra={"clicks": len(batch), "error": repr(e)})
+            return
+        try:
+            await increment_click_counters([
+                (short_code, created_at)
+                for short_code, _, _, created_at in batch
+                if short_code in link_ids
+            ])
+        except Exception as e:
+            logger.error("Не удалось обновить счетчики кликов", extra={"clicks": len(batch), "error": repr(e)})
+
+click_writer = ClickWriter()
+
+
+async def increment_click_counters(clicks: list[tuple[str, datetime]]):
+    """Обновляет предагрегированные счетчики кликов (всего, по часам и дням) одним пайплайном."""
+    if not clicks:
+        return
+    totals = Counter()
+    hours = Counter()
+    days = Counter()
+    last_seen = {}
+    for short_code, created_at in clicks:
+        totals[short_code] += 1
+        hours[short_code, created_at.strftime(HOUR_BUCKET_FORMAT)] += 1
+        days[short_code, created_at.strftime(DAY_BUCKET_FORMAT)] += 1
+        last_seen[short_code] = max(created_at, last_seen.get(short_code, created_at))
+    async with cache.get_client().pipeline(transaction=False) as pipe:
+        for short_code, count in totals.items():
+            key = f"{CLICK_COUNTER_PREFIX}{short_code}"
+            pipe.hincrby(key, "total", count)
+            pipe.hset(key, "last", last_seen[short_code].isoformat())
+        for (short_code, bucket), count in hours.items():
+            pipe.hincrby(f"{CLICK_COUNTER_PREFIX}{short_code}:h", bucket, count)
+        for (short_code, bucket), count in days.items():
+            pipe.hincrby(f"{CLICK_COUNTER_PREFIX}{short_code}:d", bucket, count)
+        for short_code in totals:
+            pipe.expire(f"{CLICK_COUNTER_PREFIX}{short_code}:h", BUCKET_TTL)
+            pipe.expire(f"{CLICK_COUNTER_PREFIX}{short_code}:d", BUCKET_TTL)
+        await pipe.execute()
+
+
+async def get_click_stats(
+        short_code: str,
+        redis_client: redis.Redis
+        ):
+    """Читает счетчики кликов ссылки: O(число бакетов), без сканирования link_stats."""
+    async with cache.cache_pipeline(redis_client, name=CLICK_COUNTER_PREFIX) as batch:
+        stats = queue_click_stats(batch, short_code)
+    return stats.value
+
+
+def queue_click_stats(
+        batch: cache.CacheBatch,
+        short_code: str
+        ) -> cache.BatchResult:
+    """Ставит чтение счетчиков кликов в общий пайплайн; работает и с клиентом без decode_responses."""
+    now = datetime.utcnow()
+    hour_buckets = [
+        (now - timedelta(hours=i)).strftime(HOUR_BUCKET_FORMAT)
+        for i in reversed(range(CLICK_STATS_HOURS))
+    ]
+    day_buckets = [
+        (now - timedelta(days=i)).strftime(DAY_BUCKET_FORMAT)
+        for i in reversed(range(CLICK_STATS_DAYS))
+    ]
+    key = f"{CLICK_COUNTER_PREFIX}{short_code}"
+
+    def queue(pipe):
+        pipe.hmget(key, "total", "last")
+        pipe.hmget(f"{key}:h", hour_buckets)
+        pipe.hmget(f"{key}:d", day_buckets)
+
+    def parse(responses):
+        (total, last), hour_counts, day_counts = responses
+        if isinstance(last, bytes):
+            last = last.decode()
+        return {
+            "clicks": int(total or 0),
+            "last_accessed_at": datetime.fromisoformat(last) if last else None,
+            "clicks_by_hour": {b: int(c or 0) for b, c in zip(hour_buckets, hour_counts)},
+            "clicks_by_day": {b: int(c or 0) for b, c in zip(day_buckets, day_counts)}
+        }
+
+    return batch.add(queue, parse)
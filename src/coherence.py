@@ -0,0 +1,64 @@
+from src.config import CACHE_INVALIDATION_CHANNEL, CACHE_WRITE_THROUGH, NEGATIVE_CACHE_TTL
+from src.cache import LINK_CACHE_PREFIX, LINK_CACHE_TTL, NEGATIVE_CACHE_PREFIX
+from src.cache import local_cache, link_cache_ttl
+from src.clicks import CLICK_COUNTER_PREFIX
+from src.records import link_record, pack_link
+from src.database import Link
+import redis.asyncio as redis
+
+# Все ключи Redis, которые кэшируют данные одной ссылки:
+#   link:<code>   - msgpack запись ссылки для редиректа и /stats (плюс копия в L1 каждого воркера)
+#   neg:<code>    - негативный кэш несуществующего кода
+#   clicks:<code> - счетчики кликов (и бакеты :h, :d)
+# Ключи dedup:<user>:<hash> проверяются при чтении и чинятся сами.
+
+def queue_link_removal(pipe, short_code: str):
+    """Добавляет в пайплайн удаление всех ключей ссылки и рассылку инвалидации L1."""
+    link_key = f"{LINK_CACHE_PREFIX}{short_code}"
+    click_key = f"{CLICK_COUNTER_PREFIX}{short_code}"
+    pipe.delete(link_key, click_key, f"{click_key}:h", f"{click_key}:d")
+    pipe.publish(CACHE_INVALIDATION_CHANNEL, link_key)
+    local_cache.delete(link_key)
+
+async def link_updated(
+        db_link: Link, 
+        redis_client: redis.Redis,
+        write_through: bool = CACHE_WRITE_THROUGH
+        ):
+    """Приводит кэш в соответствие с измененной ссылкой одной транзакцией Redis.
+
+    В режиме write-through новая запись link: пишется сразу,
+    иначе старая удаляется и загрузится при следующем чтении.
+    """
+    short_code = db_link.short_code
+    link_key = f"{LINK_CACHE_PREFIX}{short_code}"
+    record = link_record(db_link)
+    async with redis_client.pipeline(transaction=True) as pipe:
+        if write_through:
+            ttl = link_cache_ttl(record.expires_at, LINK_CACHE_TTL)
+            pipe.set(link_key, pack_link(record), ex=ttl)
+        else:
+            pipe.delete(link_key)
+        pipe.delete(f"{NEGATIVE_CACHE_PREFIX}{short_code}")
+        pipe.publish(CACHE_INVALIDATION_CHANNEL, link_key)
+        await pipe.execute()
+    # Свое же сообщение инвалидации может удалить запись из L1 - тогда она перечитается из Redis
+    if write_through:
+        local_cache.set(link_key, record, ttl=ttl, source_ttl=ttl)
+    else:
+        local_cache.delete(link_key)
+
+async def link_deleted(
+        short_code: str, 
+        redis_client: redis.Redis,
+        write_through: bool = CACHE_WRITE_THROUGH
+        ):
+    """Удаляет все ключи ссылки одной транзакцией Redis.
+
+    В режиме write-through код сразу попадает в негативный кэш.
+    """
+    async with redis_client.pipeline(transaction=True) as pipe:
+        queue_link_removal(pipe, short_code)
+        if write_through:
+            pipe.set(f"{NEGATIVE_CACHE_PREFIX}{short_code}", "1", ex=NEGATIVE_CACHE_TTL)
+        await pipe.execute()
@@ -7,4 +7,74 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM")
 REDIS_HOST = os.getenv("REDIS_HOST")
-REDIS_PORT = int(os.getenv("REDIS_PORT"))
\ No newline at end of file
+REDIS_PORT = int(os.getenv("REDIS_PORT"))
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 100)) # на каждый из двух пулов воркера
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", 5)) # ожидание свободного соединения, с
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 5))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", 2))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
+REDIS_RETRY_ATTEMPTS = int(os.getenv("REDIS_RETRY_ATTEMPTS", 3))
+REDIS_RETRY_BACKOFF_BASE = float(os.getenv("REDIS_RETRY_BACKOFF_BASE", 0.01))
+REDIS_RETRY_BACKOFF_CAP = float(os.getenv("REDIS_RETRY_BACKOFF_CAP", 0.5))
+
+L1_CACHE_MAXSIZE = int(os.getenv("L1_CACHE_MAXSIZE", 10000))
+L1_CACHE_TTL = int(os.getenv("L1_CACHE_TTL", 60))
+CACHE_INVALIDATION_CHANNEL = os.getenv("CACHE_INVALIDATION_CHANNEL", "cache:invalidate")
+
+ID_ALLOCATOR_BACKEND = os.getenv("ID_ALLOCATOR_BACKEND", "db") # db или redis
+ID_BLOCK_SIZE = int(os.getenv("ID_BLOCK_SIZE", 1000))
+# Длина и ключ задаются до выдачи первых ссылок и не меняются: выданные коды перестанут декодироваться
+# в id своих ссылок. При смене миграции переносят их в link_aliases, но это аварийный путь, а не ротация
+SHORT_CODE_LENGTH = int(os.getenv("SHORT_CODE_LENGTH", 7)) # 62^7 ~ 3.5 * 10^12 кодов
+# Ключ перестановки кодов, обязателен
+SHORT_CODE_SECRET = os.getenv("SHORT_CODE_SECRET")
+
+CLICK_QUEUE_MAXSIZE = int(os.getenv("CLICK_QUEUE_MAXSIZE", 10000))
+CLICK_BATCH_SIZE = int(os.getenv("CLICK_BATCH_SIZE", 500))
+CLICK_FLUSH_INTERVAL = float(os.getenv("CLICK_FLUSH_INTERVAL", 1.0))
+CLICK_STATS_HOURS = int(os.getenv("CLICK_STATS_HOURS", 24))
+CLICK_STATS_DAYS = int(os.getenv("CLICK_STATS_DAYS", 30))
+
+LINK_BATCH_MAX_SIZE = int(os.getenv("LINK_BATCH_MAX_SIZE", 50000))
+RESOLVE_BATCH_MAX_SIZE = int(os.getenv("RESOLVE_BATCH_MAX_SIZE", 1000))
+
+EXPIRY_SWEEP_INTERVAL = int(os.getenv("EXPIRY_SWEEP_INTERVAL", 60))
+EXPIRY_SWEEP_BATCH = int(os.getenv("EXPIRY_SWEEP_BATCH", 1000))
+
+NEGATIVE_CACHE_TTL = int(os.getenv("NEGATIVE_CACHE_TTL", 30))
+BLOOM_FILTER_BITS = int(os.getenv("BLOOM_FILTER_BITS", 2 ** 26))
+BLOOM_FILTER_HASHES = int(os.getenv("BLOOM_FILTER_HASHES", 7))
+BLOOM_CHECK_INTERVAL = int(os.getenv("BLOOM_CHECK_INTERVAL", 300))
+
+JWT_STATELESS = os.getenv("JWT_STATELESS", "true").lower() == "true"
+USER_CACHE_MAXSIZE = int(os.getenv("USER_CACHE_MAXSIZE", 10000))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 60))
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+BCRYPT_POOL_SIZE = int(os.getenv("BCRYPT_POOL_SIZE", 4))
+BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", 64))
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000)) # мс
+SQLITE_SINGLE_WRITER = os.getenv("SQLITE_SINGLE_WRITER", "true").lower() == "true"
+
+SHORTEN_DEDUP = os.getenv("SHORTEN_DEDUP", "false").lower() == "true"
+DEDUP_CACHE_TTL = int(os.getenv("DEDUP_CACHE_TTL", 86400))
+DEDUP_LOCK_TIMEOUT = float(os.getenv("DEDUP_LOCK_TIMEOUT", 5))
+
+CACHE_LOCK_TIMEOUT = float(os.getenv("CACHE_LOCK_TIMEOUT", 5))
+CACHE_LOCK_WAIT = float(os.getenv("CACHE_LOCK_WAIT", 0.5))
+CACHE_EARLY_REFRESH_DELTA = float(os.getenv("CACHE_EARLY_REFRESH_DELTA", 1)) # с, оценка времени загрузки из БД
+CACHE_EARLY_REFRESH_BETA = float(os.getenv("CACHE_EARLY_REFRESH_BETA", 1))
+CACHE_WRITE_THROUGH = os.getenv("CACHE_WRITE_THROUGH", "true").lower() == "true"
+REDIRECT_FAST_PATH = os.getenv("REDIRECT_FAST_PATH", "true").lower() == "true"
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json") # json или text
+# Уровни и доли сэмплирования по маршрутам: "links.redirect=WARNING,auth=DEBUG"
+LOG_ROUTE_LEVELS = os.getenv("LOG_ROUTE_LEVELS", "")
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "links.redirect=0.01,links.stats=0.1")
@@ -1,17 +1,117 @@
 import sqlalchemy
-from sqlalchemy import Column, Integer, String, DateTime, BigInteger
+from sqlalchemy import Column, Integer, String, DateTime, BigInteger, event, make_url
+from sqlalchemy import Insert, Update, Delete
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
+from sqlalchemy.orm import sessionmaker, DeclarativeBase, Session
 from datetime import datetime
-from src.config import DATABASE_URL
+from src.config import DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING
+from src.config import SQLITE_BUSY_TIMEOUT, SQLITE_SINGLE_WRITER
+from src.metrics import db_query_duration, db_pool_wait
+import time
 
-engine = create_async_engine(
-    DATABASE_URL, 
-    connect_args={"check_same_thread": False} # для sqlite
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL позволяет читать параллельно с записью; остальное снижает число fsync."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+    cursor.execute("PRAGMA cache_size=-64000") # 64 МБ
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+def timed_pool_class(pool_class, label: str):
+    """Возвращает подкласс пула, который пишет в db_pool_wait время получения соединения."""
+
+    # У пула нет события "начали ждать соединение", поэтому меряем публичный connect().
+    # Подкласс, а не обертка экземпляра: recreate() после dispose() создает пул того же класса
+    class TimedPool(pool_class):
+        def connect(self):
+            start = time.perf_counter()
+            try:
+                return super().connect()
+            finally:
+                db_pool_wait.observe(time.perf_counter() - start, engine=label)
+
+    TimedPool.__name__ = f"Timed{pool_class.__name__}"
+    return TimedPool
+
+def create_engine_for_url(url: str, single_connection: bool = False, label: str = None):
+    """Создает движок с настройками под конкретную СУБД.
+
+    Postgres (asyncpg) получает пул соединений с pre-ping и recycle,
+    SQLite - WAL и pragma на каждом соединении. single_connection
+    ограничивает пул одним соединением (писатель SQLite). С label
+    движок пишет метрики запросов и ожидания пула.
+    """
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ("postgresql", "sqlite"):
+        new_engine = create_async_engine(url)
+        return instrument_engine(new_engine, label) if label else new_engine
+
+    # Класс пула задаем явно (те же, что выбрал бы SQLAlchemy), чтобы подставить замер ожидания
+    pool_class = AsyncAdaptedQueuePool
+    if backend == "postgresql":
+        engine_args = {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE,
+            "pool_pre_ping": DB_POOL_PRE_PING
+        }
+    else:
+        engine_args = {"connect_args": {"check_same_thread": False}}
+        if parsed.database in (None, "", ":memory:"):
+            pool_class = StaticPool # одна база в памяти живет только в одном соединении
+        elif single_connection:
+            engine_args.update(pool_size=1, max_overflow=0, pool_timeout=DB_POOL_TIMEOUT)
+    if label:
+        pool_class = timed_pool_class(pool_class, label)
+    new_engine = create_async_engine(url, poolclass=pool_class, **engine_args)
+    if backend == "sqlite":
+        event.listen(new_engine.sync_engine, "connect", _set_sqlite_pragmas)
+    return instrument_engine(new_engine, label) if label else new_engine
+
+def instrument_engine(async_engine, label: str):
+    """Подключает к движку метрику времени SQL запросов."""
+    sync_engine = async_engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        db_query_duration.observe(time.perf_counter() - conn.info["query_start"].pop(), engine=label)
+
+    return async_engine
+
+def uses_single_writer(url: str) -> bool:
+    """Отдельный писатель нужен только файловой SQLite."""
+    parsed = make_url(url)
+    return (
+        SQLITE_SINGLE_WRITER
+        and parsed.get_backend_name() == "sqlite"
+        and parsed.database not in (None, "", ":memory:")
+    )
+
+engine = create_engine_for_url(DATABASE_URL, label="main")
+writer_engine = (
+    create_engine_for_url(DATABASE_URL, single_connection=True, label="writer")
+    if uses_single_writer(DATABASE_URL) else None
 )
 
+class RoutingSession(Session):
+    """Отправляет записи в движок-писатель, а чтения - в общий пул."""
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if writer_engine is not None and (self._flushing or isinstance(clause, (Insert, Update, Delete))):
+            return writer_engine.sync_engine
+        return engine.sync_engine
+
 async_session = sessionmaker(
-    engine, expire_on_commit=False, class_=AsyncSession
+    engine, expire_on_commit=False, class_=AsyncSession, sync_session_class=RoutingSession
 )
 
 class Base(DeclarativeBase):
@@ -49,24 +149,46 @@ class Link(Base):
         primary_key= True,
         index= True
     )
-    short_code = Column(
-        String,
-        unique= True,
-        index= True
-    )
+    # Сгенерированный код - обратимая перестановка id (src/short_codes.py), поэтому ссылка
+    # ищется по первичному ключу и отдельный индекс по short_code не нужен
+    short_code = Column(String)
     original_url = Column(String)
+    original_url_hash = Column(
+        String(64),
+        nullable= True
+    )
     created_at = Column(
         DateTime,
         default= datetime.utcnow
     )
     expires_at = Column(
         DateTime,
-        nullable= True
+        nullable= True,
+        index= True
     )
     user_id = Column(
         Integer,
         sqlalchemy.ForeignKey("users.id"),
-        nullable= True
+        nullable= True,
+        index= True
+    )
+
+    __table_args__ = (
+        sqlalchemy.Index("ix_links_user_id_original_url_hash", "user_id", "original_url_hash"),
+    )
+
+class LinkAlias(Base):
+    """Коды, которые не декодируются в id своей ссылки: пользовательские alias и старые коды."""
+    __tablename__ = "link_aliases"
+
+    alias = Column(
+        String,
+        primary_key= True
+    )
+    link_id = Column(
+        Integer,
+        sqlalchemy.ForeignKey("links.id"),
+        index= True
     )
 
 class LinkStats(Base):
@@ -107,12 +229,52 @@ class Counter(Base):
     )
 
 
+class LazySession:
+    """Прокси AsyncSession, создающий сессию только при первом обращении к ней.
+
+    Запросы, которые целиком обслужил кэш, не берут сессию и соединение
+    из пула. Счетчики класса показывают, сколько запросов обошлись без БД.
+    """
+
+    requests = 0
+    opened = 0
+
+    def __init__(self, factory=None):
+        self._factory = factory or async_session
+        self._session = None
+        LazySession.requests += 1
+
+    @property
+    def session(self) -> AsyncSession:
+        if self._session is None:
+            self._session = self._factory()
+            LazySession.opened += 1
+        return self._session
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    async def close(self):
+        """Закрывает сессию, если она создавалась."""
+        if self._session is not None:
+            await self._session.close()
+
+    @classmethod
+    def stats(cls):
+        """Возвращает число запросов, открывших сессию и обошедшихся без нее."""
+        return {
+            "requests": cls.requests,
+            "opened": cls.opened,
+            "unused": cls.requests - cls.opened
+        }
+
+
 async def get_db():
-    async with async_session() as session:
-        try:
-            yield session
-        finally:
-            await session.close()
+    session = LazySession()
+    try:
+        yield session
+    finally:
+        await session.close()
 
 
 async def create_database():
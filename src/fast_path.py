@@ -0,0 +1,83 @@
+from src.cache import should_refresh_early
+from src.clicks import click_writer
+from src.records import get_link_record
+from src.routers.links_router import schedule_link_refresh
+import src.cache as cache
+import redis.asyncio as redis
+from fastapi import APIRouter
+from urllib.parse import quote
+
+# Как в starlette.responses.RedirectResponse
+LOCATION_SAFE_CHARS = ":/%#?=@[]!$&'()*+,;"
+
+def static_get_paths(router: APIRouter) -> set[str]:
+    """Возвращает последние сегменты статических GET путей роутера (например, search)."""
+    return {
+        route.path.rsplit("/", 1)[1]
+        for route in router.routes
+        if "GET" in getattr(route, "methods", ()) and "{" not in route.path
+    }
+
+class RedirectFastPathMiddleware:
+    """ASGI middleware, отдающее редиректы по закэшированным ссылкам в обход FastAPI.
+
+    Обслуживает только GET {prefix}/{short_code} без заголовка Origin
+    (CORS остается за CORSMiddleware) и только при попадании в L1 или Redis.
+    Промахи и ошибки Redis уходят в полный стек приложения.
+    """
+
+    def __init__(self, app, prefix: str = "/links", reserved: set[str] = frozenset()):
+        self.app = app
+        self.prefix = prefix.rstrip("/") + "/"
+        self.reserved = set(reserved)
+        self.hits = 0
+        self.misses = 0
+
+    def _short_code(self, scope) -> str | None:
+        if scope["type"] != "http" or scope["method"] != "GET":
+            return None
+        path = scope["path"]
+        if not path.startswith(self.prefix):
+            return None
+        short_code = path[len(self.prefix):]
+        if not short_code or "/" in short_code or short_code in self.reserved:
+            return None
+        if any(name == b"origin" for name, _ in scope["headers"]):
+            return None
+        return short_code
+
+    async def __call__(self, scope, receive, send):
+        short_code = self._short_code(scope)
+        if short_code is None:
+            return await self.app(scope, receive, send)
+
+        try:
+            record, ttl = await get_link_record(short_code, cache.get_binary_client())
+        except redis.RedisError:
+            record = None
+        # Истекшую ссылку (410) и промахи обрабатывает полный стек
+        if record is None or record.is_expired():
+            self.misses += 1
+            return await self.app(scope, receive, send)
+        if ttl is not None and should_refresh_early(ttl):
+            schedule_link_refresh(short_code)
+
+        self.hits += 1
+        scope["metrics_route"] = "fast_path"
+        user_agent = None
+        for name, value in scope["headers"]:
+            if name == b"user-agent":
+                user_agent = value.decode("latin-1")
+                break
+        client = scope.get("client")
+        click_writer.record(short_code, user_agent, client[0] if client else None)
+
+        await send({
+            "type": "http.response.start",
+            "status": 302,
+            "headers": [
+                (b"location", quote(record.url, safe=LOCATION_SAFE_CHARS).encode("latin-1")),
+                (b"content-length", b"0"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": b""})
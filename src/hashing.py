@@ -0,0 +1,74 @@
+from fastapi import HTTPException, status
+from concurrent.futures import ThreadPoolExecutor
+from src.config import BCRYPT_ROUNDS, BCRYPT_POOL_SIZE, BCRYPT_MAX_PENDING
+import bcrypt
+import asyncio
+import time
+
+class PasswordHasher:
+    """Выполняет bcrypt в отдельном пуле потоков ограниченного размера.
+
+    bcrypt отпускает GIL, поэтому хеширование не блокирует event loop и
+    редиректы на том же воркере. Если в очереди уже max_pending задач,
+    новые запросы сразу получают 503 вместо бесконечного ожидания.
+    """
+
+    def __init__(
+            self,
+            workers: int = BCRYPT_POOL_SIZE,
+            max_pending: int = BCRYPT_MAX_PENDING,
+            rounds: int = BCRYPT_ROUNDS
+            ):
+        self.rounds = rounds
+        self.max_pending = max_pending
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+
+    async def _run(self, func, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many authentication requests, try again later",
+                headers={"Retry-After": "1"}
+            )
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+            self.total_seconds += time.perf_counter() - start
+
+    async def hash(self, password: str) -> str:
+        """Хеширует пароль с настроенной стоимостью BCRYPT_ROUNDS."""
+        hashed_password = await self._run(_hash_password, password.encode("utf-8"), self.rounds)
+        return hashed_password.decode("ascii")
+
+    async def verify(self, password: str, hashed_password: str | bytes) -> bool:
+        """Проверяет пароль против сохраненного хеша (старые хеши хранились как bytes)."""
+        if isinstance(hashed_password, str):
+            hashed_password = hashed_password.encode("ascii")
+        return await self._run(bcrypt.checkpw, password.encode("utf-8"), hashed_password)
+
+    def stats(self):
+        """Возвращает метрики пула: очередь, выполненные и отклоненные задачи."""
+        return {
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_seconds": self.total_seconds / self.completed if self.completed else 0.0
+        }
+
+    def shutdown(self):
+        """Останавливает пул потоков."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+def _hash_password(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds))
+
+password_hasher = PasswordHasher()
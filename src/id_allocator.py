@@ -0,0 +1,102 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, func
+from sqlalchemy.exc import IntegrityError
+from src.database import Counter, Link
+from src.config import ID_ALLOCATOR_BACKEND, ID_BLOCK_SIZE
+import src.cache as cache
+import asyncio
+
+COUNTER_ROW_ID = 1
+COUNTER_REDIS_KEY = "counter:links"
+# Поднимает счетчик в Redis до уже занятых значений из БД (но никогда не опускает)
+# и резервирует блок - атомарно, поэтому потерянный или откатившийся ключ
+# не выдаст использованные id
+RESERVE_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+if current < tonumber(ARGV[1]) then
+    redis.call('SET', KEYS[1], ARGV[1])
+end
+return redis.call('INCRBY', KEYS[1], ARGV[2])
+"""
+
+class IdAllocator:
+    """Выдает уникальные значения счетчика из заранее зарезервированных блоков.
+
+    Каждый воркер резервирует диапазон из block_size значений одной транзакцией
+    (строка Counter в БД или INCRBY в Redis) и раздает его из памяти.
+    В Counter.next_value хранится верхняя граница уже выданных диапазонов.
+    В режиме Redis каждое резервирование сначала поднимает счетчик выше
+    max(links.id), так что Redis может потерять ключ без повторной выдачи id.
+    """
+
+    def __init__(
+            self,
+            block_size: int = ID_BLOCK_SIZE,
+            backend: str = ID_ALLOCATOR_BACKEND,
+            redis_key: str = COUNTER_REDIS_KEY
+            ):
+        self.block_size = block_size
+        self.backend = backend
+        self.redis_key = redis_key
+        self._next = 1
+        self._end = 0 # включительно
+        self._lock = asyncio.Lock()
+
+    def _available(self):
+        return self._end - self._next + 1
+
+    async def allocate(self, db: AsyncSession) -> int:
+        """Возвращает одно следующее значение счетчика."""
+        return (await self.allocate_many(1, db))[0]
+
+    async def allocate_many(self, count: int, db: AsyncSession) -> list[int]:
+        """Возвращает count значений, резервируя недостающие одним запросом."""
+        async with self._lock:
+            values = []
+            while len(values) < count:
+                if self._available() == 0:
+                    size = max(self.block_size, count - len(values))
+                    end = await self._reserve(size, db)
+                    self._next, self._end = end - size + 1, end
+                take = min(self._available(), count - len(values))
+                values.extend(range(self._next, self._next + take))
+                self._next += take
+            return values
+
+    async def _reserve(self, size: int, db: AsyncSession) -> int:
+        """Резервирует диапазон из size значений и возвращает его верхнюю границу."""
+        if self.backend == "redis":
+            return await self._reserve_redis(size, db)
+        return await self._reserve_db(size, db)
+
+    async def _reserve_db(self, size: int, db: AsyncSession) -> int:
+        while True:
+            result = await db.execute(
+                update(Counter)
+                .where(Counter.id == COUNTER_ROW_ID)
+                .values(next_value=Counter.next_value + size)
+                .returning(Counter.next_value)
+            )
+            end = result.scalar_one_or_none()
+            if end is not None:
+                await db.commit()
+                return end
+            db.add(Counter(id=COUNTER_ROW_ID, next_value=size))
+            try:
+                await db.commit()
+                return size
+            except IntegrityError:
+                # Строку счетчика параллельно создал другой воркер
+                await db.rollback()
+
+    async def _reserve_redis(self, size: int, db: AsyncSession) -> int:
+        # Занятые id: max(id) берется по первичному ключу, счетчик БД - на случай перехода с режима db
+        result = await db.execute(select(
+            select(func.max(Link.id)).scalar_subquery(),
+            select(Counter.next_value).where(Counter.id == COUNTER_ROW_ID).scalar_subquery()
+        ))
+        max_id, counter = result.one()
+        floor = max(max_id or 0, counter or 0)
+        return await cache.get_client().eval(RESERVE_SCRIPT, 1, self.redis_key, floor, size)
+
+id_allocator = IdAllocator()
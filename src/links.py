@@ -1,64 +1,292 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from src.database import Link, Counter
+from sqlalchemy import select, delete, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+from src.database import Link, LinkAlias, LinkStats
+from src.id_allocator import id_allocator
+from src.short_codes import short_codes
 import src.utils as utils
 from fastapi import HTTPException, status
 from datetime import datetime
-from src.models import LinkCreate
+from src.models import LinkCreate, BatchLinkResult
+from src.config import SHORTEN_DEDUP, DEDUP_CACHE_TTL, DEDUP_LOCK_TIMEOUT
+import redis.asyncio as redis
+from redis.exceptions import LockError
+
+IN_QUERY_CHUNK = 10000 # Держимся ниже лимита параметров SQLite/asyncpg
+DEDUP_PREFIX = "dedup:"
+GENERATED_ALIAS_DETAIL = "This alias looks like a generated short code"
 
 async def get_next_counter_value(db: AsyncSession):
-    """Получает следующее значение счетчика из базы данных"""
-    result = await db.execute(select(Counter))
-    counter = result.scalar_one_or_none()
-    if not counter:
-        counter = Counter(next_value=1)
-        db.add(counter)
-    else:
-        counter.next_value += 1
-    await db.commit()
-    return counter.next_value
+    """Получает следующее значение счетчика из зарезервированного воркером блока"""
+    return await id_allocator.allocate(db)
 
 async def create_short_link(
         link: LinkCreate, 
         user_id: int | None, 
-        db: AsyncSession
+        db: AsyncSession,
+        redis_client: redis.Redis = None
         ):
     """Создает новую короткую ссылку"""
+    if should_deduplicate(link):
+        return await create_deduplicated_link(link, user_id, db, redis_client)
     #Проверяем alias
     if link.custom_alias:
-        result = await db.execute(select(Link).where(Link.short_code == link.custom_alias))
-        existing_link = result.scalar_one_or_none()
-        if existing_link:
+        if is_generated_code(link.custom_alias):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=GENERATED_ALIAS_DETAIL
+            )
+        if await db.get(LinkAlias, link.custom_alias) is not None:
            raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="This alias is already taken"
             )
-    #Получаем short code
-    if link.custom_alias:
-        short_code = link.custom_alias
-    else:
-        counter_value = await get_next_counter_value(db)
-        short_code = utils.encode(counter_value)
-    #Создаем ссылку
+    return await save_link(await get_next_counter_value(db), link, user_id, db)
+
+async def save_link(
+        link_id: int, 
+        link: LinkCreate, 
+        user_id: int | None, 
+        db: AsyncSession
+        ):
+    """Сохраняет ссылку с id из счетчика: код - alias или перестановка id"""
     db_link = Link(
-        short_code=short_code,
+        id=link_id,
+        short_code=link.custom_alias or short_codes.encode(link_id),
         original_url=link.original_url,
+        original_url_hash=utils.url_hash(link.original_url),
         created_at=datetime.utcnow(),
         expires_at=link.expires_at,
         user_id=user_id
     )
     db.add(db_link)
+    if link.custom_alias:
+        await db.flush() # строка links должна появиться раньше ссылки на нее
+        db.add(LinkAlias(alias=link.custom_alias, link_id=link_id))
     await db.commit()
     await db.refresh(db_link)
     return db_link
 
+def is_generated_code(code: str) -> bool:
+    """Код такого вида может выдать генератор, поэтому как alias он запрещен."""
+    return short_codes.decode(code) is not None
+
+async def find_link(
+        short_code: str, 
+        db: AsyncSession
+        ) -> Link | None:
+    """Находит ссылку по коду: сгенерированный декодируется в первичный ключ, alias ищется в link_aliases"""
+    link_id = short_codes.decode(short_code)
+    if link_id is not None:
+        db_link = await db.get(Link, link_id)
+        # Старый код той же длины может декодироваться в id чужой ссылки
+        if db_link is not None and db_link.short_code == short_code:
+            return db_link
+    result = await db.execute(
+        select(Link).join(LinkAlias, LinkAlias.link_id == Link.id).where(LinkAlias.alias == short_code)
+    )
+    return result.scalar_one_or_none()
+
+def should_deduplicate(link: LinkCreate) -> bool:
+    """Дедупликация применяется только к бессрочным ссылкам без alias"""
+    enabled = SHORTEN_DEDUP if link.dedupe is None else link.dedupe
+    return enabled and not link.custom_alias and link.expires_at is None
+
+async def find_duplicate_link(
+        original_url: str, 
+        user_id: int | None, 
+        db: AsyncSession,
+        redis_client: redis.Redis = None
+        ):
+    """Ищет бессрочную ссылку пользователя на тот же URL: сначала в Redis, затем по индексу.
+
+    Хеш только сужает поиск, совпадение подтверждается сравнением нормализованных URL.
+    """
+    normalized_url = utils.normalize_url(original_url)
+    original_url_hash = utils.url_hash(original_url)
+    dedup_key = f"{DEDUP_PREFIX}{user_id or 0}:{original_url_hash}"
+    if redis_client is not None:
+        short_code = await redis_client.get(dedup_key)
+        if short_code:
+            db_link = await find_link(short_code, db)
+            # Ссылку могли удалить или сменить ей URL - тогда ключ устарел
+            if (
+                db_link is not None
+                and db_link.user_id == user_id
+                and utils.same_url(db_link.original_url, normalized_url)
+                and db_link.expires_at is None
+            ):
+                return db_link
+            await redis_client.delete(dedup_key)
+    result = await db.execute(
+        select(Link)
+        .where(
+            Link.user_id == user_id,
+            Link.original_url_hash == original_url_hash,
+            Link.expires_at.is_(None)
+        )
+        .order_by(Link.id)
+    )
+    db_link = next(
+        (candidate for candidate in result.scalars() if utils.same_url(candidate.original_url, normalized_url)),
+        None
+    )
+    if db_link is not None and redis_client is not None:
+        await redis_client.set(dedup_key, db_link.short_code, ex=DEDUP_CACHE_TTL)
+    return db_link
+
+async def create_deduplicated_link(
+        link: LinkCreate, 
+        user_id: int | None, 
+        db: AsyncSession,
+        redis_client: redis.Redis = None
+        ):
+    """Возвращает существующую ссылку на тот же URL или создает новую.
+
+    Создание идет под блокировкой Redis на (пользователь, хеш URL), поэтому
+    параллельные одинаковые запросы получают одну и ту же ссылку.
+    """
+    original_url_hash = utils.url_hash(link.original_url)
+    db_link = await find_duplicate_link(link.original_url, user_id, db, redis_client)
+    if db_link is not None:
+        return db_link
+    if redis_client is None:
+        return await save_link(await get_next_counter_value(db), link, user_id, db)
+
+    dedup_key = f"{DEDUP_PREFIX}{user_id or 0}:{original_url_hash}"
+    lock = redis_client.lock(
+        f"lock:{dedup_key}",
+        timeout=DEDUP_LOCK_TIMEOUT,
+        blocking_timeout=DEDUP_LOCK_TIMEOUT,
+        sleep=0.01
+    )
+    if not await lock.acquire():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Could not deduplicate link, try again later"
+        )
+    try:
+        # Пока ждали блокировку, ссылку мог создать параллельный запрос
+        db_link = await find_duplicate_link(link.original_url, user_id, db, redis_client)
+        if db_link is None:
+            db_link = await save_link(await get_next_counter_value(db), link, user_id, db)
+            await redis_client.set(dedup_key, db_link.short_code, ex=DEDUP_CACHE_TTL)
+        return db_link
+    finally:
+        try:
+            await lock.release()
+        except LockError:
+            pass # блокировка уже истекла по таймауту
+
+async def create_short_links_batch(
+        links: list[LinkCreate], 
+        user_id: int | None, 
+        db: AsyncSession
+        ):
+    """Создает пачку коротких ссылок: одна проверка alias, один резерв счетчика, одна вставка"""
+    taken = await find_taken_aliases(list({link.custom_alias for link in links if link.custom_alias}), db)
+
+    accepted = []
+    results = []
+    conflicts = []
+    for index, link in enumerate(links):
+        if link.custom_alias:
+            detail = None
+            if is_generated_code(link.custom_alias):
+                detail = GENERATED_ALIAS_DETAIL
+            elif link.custom_alias in taken:
+                detail = "This alias is already taken"
+            if detail:
+                conflicts.append(link.custom_alias)
+                results.append(BatchLinkResult(
+                    index=index,
+                    status="conflict",
+                    original_url=link.original_url,
+                    short_code=link.custom_alias,
+                    detail=detail
+                ))
+                continue
+            taken.add(link.custom_alias) # повтор alias внутри пачки тоже конфликт
+        accepted.append((index, link))
+        results.append(None) # заполняется после выделения id
+
+    link_ids = await id_allocator.allocate_many(len(accepted), db) if accepted else []
+    generated_codes = iter(short_codes.encode_many(
+        link_id for (_, link), link_id in zip(accepted, link_ids) if not link.custom_alias
+    ))
+    now = datetime.utcnow()
+    rows = []
+    alias_rows = []
+    for (index, link), link_id in zip(accepted, link_ids):
+        if link.custom_alias:
+            short_code = link.custom_alias
+            alias_rows.append({"alias": short_code, "link_id": link_id})
+        else:
+            short_code = next(generated_codes)
+        rows.append({
+            "id": link_id,
+            "short_code": short_code,
+            "original_url": link.original_url,
+            "original_url_hash": utils.url_hash(link.original_url),
+            "created_at": now,
+            "expires_at": link.expires_at,
+            "user_id": user_id
+        })
+        results[index] = BatchLinkResult(
+            index=index,
+            status="created",
+            original_url=link.original_url,
+            short_code=short_code,
+            expires_at=link.expires_at
+        )
+    while rows:
+        try:
+            await db.execute(insert(Link), rows)
+            if alias_rows:
+                await db.execute(insert(LinkAlias), alias_rows)
+            await db.commit()
+            break
+        except IntegrityError:
+            await db.rollback()
+            # Alias заняли параллельно между проверкой и вставкой: проигравшие - конфликты, остальные вставляем заново
+            lost = await find_taken_aliases([row["alias"] for row in alias_rows], db)
+            if not lost:
+                raise
+            lost_ids = {row["link_id"] for row in alias_rows if row["alias"] in lost}
+            rows = [row for row in rows if row["id"] not in lost_ids]
+            alias_rows = [row for row in alias_rows if row["link_id"] not in lost_ids]
+            for index, result in enumerate(results):
+                if result.status == "created" and result.short_code in lost:
+                    conflicts.append(result.short_code)
+                    results[index] = BatchLinkResult(
+                        index=index,
+                        status="conflict",
+                        original_url=result.original_url,
+                        short_code=result.short_code,
+                        detail="This alias is already taken"
+                    )
+    return {"created": len(rows), "conflicts": conflicts, "results": results}
+
+async def find_taken_aliases(
+        aliases: list[str], 
+        db: AsyncSession
+        ) -> set[str]:
+    """Возвращает alias из списка, которые уже заняты в link_aliases"""
+    taken = set()
+    for i in range(0, len(aliases), IN_QUERY_CHUNK):
+        result = await db.execute(
+            select(LinkAlias.alias).where(LinkAlias.alias.in_(aliases[i:i + IN_QUERY_CHUNK]))
+        )
+        taken.update(result.scalars())
+    return taken
+
 async def get_original_url(
         short_code: str, 
         db: AsyncSession
         ):
     """Получает оригинальный URL по короткому коду"""
-    result = await db.execute(select(Link).where(Link.short_code == short_code))
-    db_link = result.scalar_one_or_none()
+    db_link = await find_link(short_code, db)
     if not db_link:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -66,6 +294,34 @@ async def get_original_url(
         )
     return db_link
 
+async def get_links_by_short_codes(
+        codes: list[str], 
+        db: AsyncSession
+        ):
+    """Загружает ссылки по списку коротких кодов: IN по первичному ключу, остаток - по link_aliases"""
+    links = {}
+    by_id = {}
+    for code in codes:
+        link_id = short_codes.decode(code)
+        if link_id is not None:
+            by_id[link_id] = code
+    link_ids = list(by_id)
+    for i in range(0, len(link_ids), IN_QUERY_CHUNK):
+        result = await db.execute(select(Link).where(Link.id.in_(link_ids[i:i + IN_QUERY_CHUNK])))
+        links.update(
+            (db_link.short_code, db_link) for db_link in result.scalars()
+            if db_link.short_code == by_id[db_link.id]
+        )
+    aliases = [code for code in codes if code not in links]
+    for i in range(0, len(aliases), IN_QUERY_CHUNK):
+        result = await db.execute(
+            select(LinkAlias.alias, Link)
+            .join(Link, LinkAlias.link_id == Link.id)
+            .where(LinkAlias.alias.in_(aliases[i:i + IN_QUERY_CHUNK]))
+        )
+        links.update(result.all())
+    return links
+
 async def update_link(
         short_code: str, 
         original_url: str,
@@ -73,8 +329,7 @@ async def update_link(
         user_id:int
         ):
     """Обновляет оригинальный URL короткой ссылки"""
-    result = await db.execute(select(Link).where(Link.short_code == short_code))
-    db_link = result.scalar_one_or_none()
+    db_link = await find_link(short_code, db)
     if not db_link:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -86,8 +341,18 @@ async def update_link(
             detail="You are not authorized to update this link"
         )
     db_link.original_url = original_url
-    await db.commit()
-    await db.refresh(db_link)
+    db_link.original_url_hash = utils.url_hash(original_url)
+    try:
+        await db.commit()
+    except StaleDataError:
+        # Ссылку удалили параллельным запросом между SELECT и UPDATE
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Short link not found"
+        )
+    # expire_on_commit=False: объект уже актуален, повторный SELECT не нужен
+    # и падал бы, если ссылку удалили сразу после коммита
     return db_link
 
 async def delete_link(
@@ -96,8 +361,7 @@ async def delete_link(
         user_id:int
         ):
     """Удаляет короткую ссылку"""
-    result = await db.execute(select(Link).where(Link.short_code == short_code))
-    db_link = result.scalar_one_or_none()
+    db_link = await find_link(short_code, db)
     if not db_link:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -108,6 +372,8 @@ async def delete_link(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You are not authorized to delete this link"
         )
+    await db.execute(delete(LinkStats).where(LinkStats.link_id == db_link.id))
+    await db.execute(delete(LinkAlias).where(LinkAlias.link_id == db_link.id))
     await db.delete(db_link)
     await db.commit()
     return {"message": "Link deleted successfully"}
@@ -117,12 +383,18 @@ async def search_link_by_original_url(
         db: AsyncSession, 
         user_id:int
         ):
-    """Ищет короткую ссылку по оригинальному URL"""
+    """Ищет короткую ссылку по оригинальному URL (по индексу user_id + хеш нормализованного URL)"""
+    normalized_url = utils.normalize_url(original_url)
     result = await db.execute(select(Link).where(
-        Link.original_url == original_url,
-        Link.user_id == user_id)
+        Link.user_id == user_id,
+        Link.original_url_hash == utils.url_hash(original_url))
+        .order_by(Link.id)
         )
-    db_link = result.scalar_one_or_none()
+    # В базе хранится исходный URL, поэтому совпадение хеша проверяем по нормализованному виду
+    db_link = next(
+        (candidate for candidate in result.scalars() if utils.same_url(candidate.original_url, normalized_url)),
+        None
+    )
     if not db_link:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -135,8 +407,7 @@ async def get_link_info(
         db:AsyncSession
         ):
     """Возвращает информацию о ссылке"""
-    result = await db.execute(select(Link).where(Link.short_code == short_code))
-    db_link = result.scalar_one_or_none()
+    db_link = await find_link(short_code, db)
     if not db_link:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -0,0 +1,104 @@
+from src.config import LOG_LEVEL, LOG_FORMAT, LOG_ROUTE_LEVELS, LOG_SAMPLE_RATES
+from logging.handlers import QueueHandler, QueueListener
+import logging
+import json
+import queue
+import random
+import sys
+
+ROOT_LOGGER = "shortener"
+
+# Атрибуты LogRecord, которые не относятся к структурированным полям из extra
+STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+def parse_route_settings(value: str) -> dict[str, str]:
+    """Разбирает строку вида "links.redirect=0.01,auth=DEBUG" в словарь."""
+    settings = {}
+    for item in value.split(","):
+        route, sep, setting = item.partition("=")
+        if sep and route.strip():
+            settings[route.strip()] = setting.strip()
+    return settings
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на событие: время, уровень, логгер, сообщение и поля из extra."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        entry.update(
+            (key, value) for key, value in vars(record).items()
+            if key not in STANDARD_ATTRS and not key.startswith("_")
+        )
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class TextFormatter(logging.Formatter):
+    """Текстовый формат: поля из extra дописываются в конец строки как key=value."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = " ".join(
+            f"{key}={value}" for key, value in vars(record).items()
+            if key not in STANDARD_ATTRS and not key.startswith("_")
+        )
+        return f"{line} {fields}" if fields else line
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только долю rate событий уровня ниже WARNING; предупреждения и ошибки - всегда."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+def get_logger(route: str) -> logging.Logger:
+    """Логгер маршрута или подсистемы, например get_logger("links.redirect")."""
+    return logging.getLogger(f"{ROOT_LOGGER}.{route}")
+
+def setup_logging(
+        level: str = LOG_LEVEL,
+        log_format: str = LOG_FORMAT,
+        route_levels: str = LOG_ROUTE_LEVELS,
+        sample_rates: str = LOG_SAMPLE_RATES,
+        stream=None
+        ) -> QueueListener:
+    """Настраивает неблокирующее логирование и возвращает запущенный QueueListener.
+
+    Обработчики запросов только кладут запись в очередь; форматирование
+    и запись в поток выполняет поток QueueListener.
+    """
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(JsonFormatter() if log_format == "json" else TextFormatter())
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+
+    root = logging.getLogger(ROOT_LOGGER)
+    for old_handler in list(root.handlers):
+        root.removeHandler(old_handler)
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(level.upper())
+    root.propagate = False
+
+    for route, route_level in parse_route_settings(route_levels).items():
+        get_logger(route).setLevel(route_level.upper())
+    for route, rate in parse_route_settings(sample_rates).items():
+        logger = get_logger(route)
+        for old_filter in list(logger.filters):
+            if isinstance(old_filter, SamplingFilter):
+                logger.removeFilter(old_filter)
+        if float(rate) < 1:
+            logger.addFilter(SamplingFilter(float(rate)))
+
+    listener.start()
+    return listener
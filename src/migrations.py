@@ -0,0 +1,211 @@
+from sqlalchemy import text, inspect, select, update, bindparam, func
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from src.database import Link, LinkAlias, Counter
+from src.id_allocator import COUNTER_ROW_ID
+from src.short_codes import short_codes
+import src.database as database
+import src.utils as utils
+from src.logs import get_logger
+import asyncio
+
+BACKFILL_BATCH = 1000
+MIGRATION_LOCK_KEY = 0x6C696E6B73 # ключ pg_advisory_xact_lock, общий для всех воркеров
+
+logger = get_logger("migrations")
+
+async def _column_names(conn: AsyncConnection, table: str) -> set[str]:
+    return await conn.run_sync(
+        lambda sync_conn: {column["name"] for column in inspect(sync_conn).get_columns(table)}
+    )
+
+def insert_ignore(conn: AsyncConnection, table, *key_columns):
+    """INSERT, пропускающий строки с уже занятым ключом (ON CONFLICT DO NOTHING)."""
+    dialect = postgresql if conn.dialect.name == "postgresql" else sqlite
+    return dialect.insert(table).on_conflict_do_nothing(index_elements=list(key_columns))
+
+async def add_expires_at_index(conn: AsyncConnection):
+    """links: индекс по expires_at для фоновой очистки."""
+    await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_links_expires_at ON links (expires_at)"))
+
+async def add_url_hash_and_user_indexes(conn: AsyncConnection):
+    """links: original_url_hash, индексы user_id и (user_id, original_url_hash)."""
+    if "original_url_hash" not in await _column_names(conn, "links"):
+        await conn.execute(text("ALTER TABLE links ADD COLUMN original_url_hash VARCHAR(64)"))
+    links = Link.__table__
+    backfill = (
+        update(links)
+        .where(links.c.id == bindparam("link_id"))
+        .values(original_url_hash=bindparam("url_hash"))
+    )
+    last_id = 0
+    while True:
+        result = await conn.execute(
+            select(links.c.id, links.c.original_url)
+            .where(links.c.id > last_id, links.c.original_url_hash.is_(None))
+            .order_by(links.c.id)
+            .limit(BACKFILL_BATCH)
+        )
+        rows = result.all()
+        if not rows:
+            break
+        await conn.execute(backfill, [
+            {"link_id": link_id, "url_hash": utils.url_hash(original_url or "")}
+            for link_id, original_url in rows
+        ])
+        last_id = rows[-1][0]
+    await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_links_user_id ON links (user_id)"))
+    await conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_links_user_id_original_url_hash ON links (user_id, original_url_hash)"
+    ))
+
+async def backfill_link_aliases(conn: AsyncConnection) -> int:
+    """Переносит в link_aliases коды, которые текущий short_codes не декодирует в id их ссылки."""
+    links = Link.__table__
+    aliases = LinkAlias.__table__
+    moved = 0
+    last_id = 0
+    while True:
+        result = await conn.execute(
+            select(links.c.id, links.c.short_code)
+            .where(links.c.id > last_id)
+            .order_by(links.c.id)
+            .limit(BACKFILL_BATCH)
+        )
+        rows = result.all()
+        if not rows:
+            break
+        # Старые коды (encode счетчика, не связанного с id) и alias не декодируются в свой id
+        missing = [
+            {"alias": short_code, "link_id": link_id} for link_id, short_code in rows
+            if short_code is not None and short_codes.decode(short_code) != link_id
+        ]
+        if missing:
+            # Alias мог уже перенести повторный запуск или другой воркер
+            await conn.execute(insert_ignore(conn, aliases, aliases.c.alias), missing)
+            moved += len(missing)
+        last_id = rows[-1][0]
+    return moved
+
+async def resolve_links_by_id(conn: AsyncConnection):
+    """links: поиск по id вместо short_code - несгенерированные коды в link_aliases, счетчик выше id, без индекса short_code."""
+    await conn.run_sync(lambda sync_conn: LinkAlias.__table__.create(sync_conn, checkfirst=True))
+    # В схемах старше счетчика таблицы counter еще нет
+    await conn.run_sync(lambda sync_conn: Counter.__table__.create(sync_conn, checkfirst=True))
+    await backfill_link_aliases(conn)
+
+    links = Link.__table__
+    # Теперь id ссылки берется из счетчика: он не должен выдать уже занятые id
+    max_id = (await conn.execute(select(func.max(links.c.id)))).scalar()
+    if max_id:
+        counter = Counter.__table__
+        await conn.execute(
+            insert_ignore(conn, counter, counter.c.id).values(id=COUNTER_ROW_ID, next_value=max_id)
+        )
+        await conn.execute(
+            update(counter)
+            .where(counter.c.id == COUNTER_ROW_ID, counter.c.next_value < max_id)
+            .values(next_value=max_id)
+        )
+    await conn.execute(text("DROP INDEX IF EXISTS ix_links_short_code"))
+
+async def rehash_urls_with_fragment(conn: AsyncConnection):
+    """links: пересчет original_url_hash для URL с фрагментом - раньше фрагмент отбрасывался при нормализации."""
+    links = Link.__table__
+    rehash = (
+        update(links)
+        .where(links.c.id == bindparam("link_id"))
+        .values(original_url_hash=bindparam("url_hash"))
+    )
+    last_id = 0
+    while True:
+        result = await conn.execute(
+            select(links.c.id, links.c.original_url)
+            .where(links.c.id > last_id, links.c.original_url.contains("#", autoescape=True))
+            .order_by(links.c.id)
+            .limit(BACKFILL_BATCH)
+        )
+        rows = result.all()
+        if not rows:
+            break
+        await conn.execute(rehash, [
+            {"link_id": link_id, "url_hash": utils.url_hash(original_url)}
+            for link_id, original_url in rows
+        ])
+        last_id = rows[-1][0]
+
+# Миграции применяются строго по возрастанию версии и должны быть идемпотентны:
+# на новой базе create_all уже создал все колонки и индексы.
+MIGRATIONS = [
+    (1, add_expires_at_index),
+    (2, add_url_hash_and_user_indexes),
+    (3, resolve_links_by_id),
+    (4, rehash_urls_with_fragment),
+]
+
+async def get_schema_version(conn: AsyncConnection) -> int:
+    await conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+    result = await conn.execute(text("SELECT MAX(version) FROM schema_version"))
+    return result.scalar() or 0
+
+async def lock_migrations(conn: AsyncConnection):
+    """Берет блокировку миграций до конца транзакции: воркеры, стартующие вместе, применяют их по очереди."""
+    if conn.dialect.name == "postgresql":
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+    elif conn.dialect.name == "sqlite":
+        # Блокировка записи всей базы; миграция может идти дольше busy_timeout
+        while True:
+            try:
+                await conn.exec_driver_sql("BEGIN IMMEDIATE")
+                return
+            except OperationalError as e:
+                if "locked" not in str(e):
+                    raise
+                await asyncio.sleep(0.1)
+
+async def sync_short_code_settings(conn: AsyncConnection):
+    """Сохраняет коды, выданные с прежними SHORT_CODE_LENGTH/SHORT_CODE_SECRET.
+
+    Такие коды не декодируются в id своей ссылки, поэтому при смене
+    настроек они переносятся в link_aliases, а не начинают отдавать 404.
+    """
+    await conn.execute(text("CREATE TABLE IF NOT EXISTS short_code_settings (fingerprint VARCHAR(32) NOT NULL)"))
+    stored = (await conn.execute(text("SELECT fingerprint FROM short_code_settings"))).scalar()
+    if stored == short_codes.fingerprint:
+        return
+    moved = await backfill_link_aliases(conn)
+    if stored is not None:
+        logger.warning(
+            "Настройки коротких кодов изменились, выданные коды перенесены в link_aliases",
+            extra={"moved": moved}
+        )
+    await conn.execute(text("DELETE FROM short_code_settings"))
+    await conn.execute(
+        text("INSERT INTO short_code_settings (fingerprint) VALUES (:fingerprint)"),
+        {"fingerprint": short_codes.fingerprint}
+    )
+
+async def run_migrations(engine: AsyncEngine = None) -> int:
+    """Применяет недостающие миграции схемы, каждую в своей транзакции.
+
+    Версия схемы перечитывается под блокировкой в той же транзакции, что и
+    миграция, поэтому уже примененную другим воркером миграцию он пропустит.
+    После миграций проверяются настройки коротких кодов.
+    """
+    engine = engine or database.engine
+    current = 0
+    for version, migrate in MIGRATIONS:
+        async with engine.begin() as conn:
+            await lock_migrations(conn)
+            current = await get_schema_version(conn)
+            if version <= current:
+                continue
+            await migrate(conn)
+            await conn.execute(text("INSERT INTO schema_version (version) VALUES (:version)"), {"version": version})
+        logger.info("Применена миграция", extra={"version": version, "description": migrate.__doc__})
+        current = version
+    async with engine.begin() as conn:
+        await lock_migrations(conn)
+        await sync_short_code_settings(conn)
+    return current
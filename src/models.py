@@ -11,6 +11,7 @@ class LinkCreate(BaseModel):
     original_url: str
     custom_alias: Optional[str] = None
     expires_at: Optional[datetime] = None
+    dedupe: Optional[bool] = None # None - по настройке SHORTEN_DEDUP
 
 class LinkInfo(BaseModel): 
     short_code:str
@@ -18,6 +19,33 @@ class LinkInfo(BaseModel):
     created_at: datetime
     expires_at: datetime | None  
 
+class LinkStatsInfo(LinkInfo):
+    clicks: int = 0
+    last_accessed_at: datetime | None = None
+    clicks_by_hour: dict[str, int] = {}
+    clicks_by_day: dict[str, int] = {}
+
+class BatchLinkResult(BaseModel):
+    index: int
+    status: str # created или conflict
+    original_url: str
+    short_code: str | None = None
+    expires_at: datetime | None = None
+    detail: str | None = None
+
+class BatchLinkResponse(BaseModel):
+    created: int
+    conflicts: list[str]
+    results: list[BatchLinkResult]
+
+class ResolveRequest(BaseModel):
+    short_codes: list[str]
+
+class ResolvedLink(BaseModel):
+    status: str # ok, expired или not_found
+    original_url: str | None = None
+    expires_at: datetime | None = None
+
 class UserInfo(BaseModel):
     id: int
     username: str
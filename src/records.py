@@ -0,0 +1,116 @@
+from src.cache import LINK_CACHE_PREFIX, LINK_CACHE_TTL, local_cache, link_cache_ttl, get_cache_with_ttl
+from src.cache import BatchResult, CacheBatch
+from src.database import Link
+from src.metrics import cache_requests
+import redis.asyncio as redis
+from datetime import datetime, timedelta
+from typing import NamedTuple
+import msgpack
+
+# Версия формата записи. Записи другой версии (и старые ключи с голым URL)
+# считаются промахом и перечитываются из БД.
+LINK_RECORD_VERSION = 1
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+class CachedLink(NamedTuple):
+    """Запись ссылки в кэше: одной записи хватает и для редиректа, и для /stats."""
+    url: str
+    created_at: datetime | None
+    expires_at: datetime | None
+    user_id: int | None
+
+    def is_expired(self) -> bool:
+        return self.expires_at is not None and datetime.utcnow() > self.expires_at
+
+def _to_micros(value: datetime | None) -> int | None:
+    return None if value is None else (value - EPOCH) // MICROSECOND
+
+def _from_micros(value: int | None) -> datetime | None:
+    return None if value is None else EPOCH + value * MICROSECOND
+
+def link_record(db_link: Link) -> CachedLink:
+    """Собирает запись кэша из строки links."""
+    return CachedLink(str(db_link.original_url), db_link.created_at, db_link.expires_at, db_link.user_id)
+
+def pack_link(record: CachedLink) -> bytes:
+    """Кодирует запись в msgpack: [версия, url, created_at, expires_at, user_id], время - в микросекундах."""
+    return msgpack.packb([
+        LINK_RECORD_VERSION,
+        record.url,
+        _to_micros(record.created_at),
+        _to_micros(record.expires_at),
+        record.user_id
+    ])
+
+def unpack_link(data: bytes | None) -> CachedLink | None:
+    """Декодирует запись; для пустых, поврежденных и чужих по версии данных возвращает None."""
+    if not data:
+        return None
+    try:
+        version, url, created_at, expires_at, user_id = msgpack.unpackb(data)
+    except (ValueError, TypeError, msgpack.UnpackException):
+        return None
+    if version != LINK_RECORD_VERSION:
+        return None
+    return CachedLink(url, _from_micros(created_at), _from_micros(expires_at), user_id)
+
+async def get_link_record(
+        short_code: str, 
+        redis_client: redis.Redis
+        ) -> tuple[CachedLink | None, int | None]:
+    """Читает запись ссылки из L1, затем из Redis (клиент без decode_responses).
+
+    Возвращает запись и оставшийся TTL ключа в Redis. При попадании в L1 TTL
+    считается по сроку ключа, запомненному вместе с записью, поэтому раннее
+    обновление срабатывает и на горячих ключах, которые читаются только из L1.
+    """
+    cache_key = f"{LINK_CACHE_PREFIX}{short_code}"
+    record, ttl = local_cache.get_with_ttl(cache_key)
+    cache_requests.inc(tier="l1", prefix=LINK_CACHE_PREFIX, result="miss" if record is None else "hit")
+    if record is not None:
+        return record, ttl
+    data, ttl = await get_cache_with_ttl(cache_key, redis_client)
+    return remember_link_record(cache_key, data, ttl), ttl
+
+def remember_link_record(
+        cache_key: str, 
+        data: bytes | None, 
+        ttl: int
+        ) -> CachedLink | None:
+    """Декодирует запись из Redis и кладет ее в L1 на оставшееся время ключа."""
+    record = unpack_link(data)
+    if record is not None:
+        ttl = ttl if ttl > 0 else None
+        local_cache.set(cache_key, record, ttl=ttl, source_ttl=ttl)
+    return record
+
+def queue_link_record(
+        batch: CacheBatch, 
+        short_code: str
+        ) -> BatchResult:
+    """Как get_link_record, но при промахе L1 ставит чтение из Redis в общий пайплайн."""
+    cache_key = f"{LINK_CACHE_PREFIX}{short_code}"
+    record, ttl = local_cache.get_with_ttl(cache_key)
+    cache_requests.inc(tier="l1", prefix=LINK_CACHE_PREFIX, result="miss" if record is None else "hit")
+    if record is not None:
+        return BatchResult((record, ttl))
+
+    def parse(responses):
+        data, ttl = responses
+        cache_requests.inc(tier="redis", prefix=LINK_CACHE_PREFIX, result="hit" if data else "miss")
+        return remember_link_record(cache_key, data, ttl), ttl
+
+    return batch.add(lambda pipe: pipe.get(cache_key).ttl(cache_key), parse)
+
+async def cache_link_record(
+        db_link: Link, 
+        redis_client: redis.Redis
+        ) -> CachedLink:
+    """Кладет запись ссылки в Redis и L1 на время, не превышающее срок жизни ссылки."""
+    cache_key = f"{LINK_CACHE_PREFIX}{db_link.short_code}"
+    record = link_record(db_link)
+    ttl = link_cache_ttl(record.expires_at, LINK_CACHE_TTL)
+    await redis_client.set(cache_key, pack_link(record), ex=ttl)
+    local_cache.set(cache_key, record, ttl=ttl, source_ttl=ttl)
+    return record
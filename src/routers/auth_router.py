@@ -2,8 +2,10 @@ from fastapi import Depends, HTTPException, status, APIRouter
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 from src.database import get_db
-from src.auth import create_user, authenticate_user, create_jwt_token
+from src.auth import create_user, authenticate_user, create_jwt_token, get_current_user, get_token_version, revoke_user_tokens, CurrentUser
 from src.models import UserCreate, UserInfo
+from src.cache import get_redis
+import redis.asyncio as redis
 
 router = APIRouter(
     prefix= "/auth",
@@ -27,20 +29,32 @@ async def register(
         )
 async def login(
     form_data: OAuth2PasswordRequestForm = Depends(), 
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    redis_client: redis.Redis = Depends(get_redis)
     ):
     user = await authenticate_user(
         form_data.username, 
         form_data.password, 
         db
         )
-    print(form_data.username)
     if not user:
-        print(f'{form_data.username} не найден')
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    token = create_jwt_token(user.username)
-    return {"access_token": token, "token_type": "bearer"}
\ No newline at end of file
+    token_version = await get_token_version(user.id, redis_client)
+    token = create_jwt_token(user.username, user.id, token_version)
+    return {"access_token": token, "token_type": "bearer"}
+
+@router.post(
+        "/revoke",
+        status_code = status.HTTP_200_OK
+        )
+async def revoke_tokens(
+    current_user: CurrentUser = Depends(get_current_user),
+    redis_client: redis.Redis = Depends(get_redis)
+    ):
+    """Отзывает все ранее выданные токены текущего пользователя."""
+    await revoke_user_tokens(current_user.id, redis_client)
+    return {"message": "All tokens revoked"}
\ No newline at end of file
@@ -1,23 +1,143 @@
-from fastapi import Depends, HTTPException, status, APIRouter
+from fastapi import Depends, HTTPException, status, APIRouter, Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.responses import RedirectResponse
+from pydantic import TypeAdapter, ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
-from src.database import get_db, User
-from src.auth import get_current_user, get_current_user_optional
-from src.links import create_short_link, get_original_url, update_link, delete_link, search_link_by_original_url, get_link_info
-from src.models import  LinkCreate, LinkInfo
+from src.database import get_db
+from src.auth import get_current_user, get_current_user_optional, CurrentUser
+from src.links import create_short_link, create_short_links_batch, get_links_by_short_codes, get_original_url, update_link, delete_link, search_link_by_original_url, get_link_info
+from src.models import  LinkCreate, LinkInfo, LinkStatsInfo, BatchLinkResponse, ResolveRequest, ResolvedLink
+from src.config import LINK_BATCH_MAX_SIZE, RESOLVE_BATCH_MAX_SIZE, CACHE_LOCK_TIMEOUT, CACHE_LOCK_WAIT
 from datetime import datetime
 from typing import Optional
 import redis.asyncio as redis
-from src.cache import get_redis, get_cache, set_cache, delete_cache
+from redis.exceptions import LockError
+from src.clicks import click_writer, get_click_stats, queue_click_stats
+from src.bloom import register_short_codes, is_known_absent, remember_absent
+from src.cache import get_redis, get_binary_redis, local_cache, link_cache_ttl, wait_for_cache, cache_pipeline
+from src.cache import LINK_CACHE_PREFIX, LINK_CACHE_TTL, NEGATIVE_CACHE_PREFIX
+from src.records import CachedLink, link_record, pack_link, unpack_link, get_link_record, cache_link_record, queue_link_record
+from src.cache import link_loads, should_refresh_early
+from src.coherence import link_updated, link_deleted
+import src.database as database
+import src.cache as cache
+from src.logs import get_logger
+from src.metrics import stage
+import logging
+import asyncio
 
 router = APIRouter(
     prefix= "/links",
     tags= ["links"]
 )
 
-LINK_CACHE_PREFIX = "link:"
-STATS_CACHE_PREFIX = "stats:"
-STATS_CACHE_TTL = 300
+redirect_logger = get_logger("links.redirect")
+stats_logger = get_logger("links.stats")
+
+def record_click(short_code: str, request: Request):
+    """Отправляет переход в фоновый конвейер статистики."""
+    click_writer.record(
+        short_code,
+        request.headers.get("user-agent"),
+        request.client.host if request.client else None
+    )
+
+async def load_link(
+    short_code: str, 
+    db: AsyncSession, 
+    redis_client: redis.Redis, 
+    loader
+    ):
+    """Загружает ссылку из БД, отсекая заведомо несуществующие коды до SQL запроса."""
+    if await is_known_absent(short_code, redis_client):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Short link not found"
+        )
+    try:
+        return await loader(short_code=short_code, db=db)
+    except HTTPException as e:
+        if e.status_code == status.HTTP_404_NOT_FOUND:
+            await remember_absent(short_code, redis_client)
+        raise
+
+def raise_link_expired():
+    raise HTTPException(
+        status_code=status.HTTP_410_GONE, 
+        detail="Short link has expired or does not exist"
+    )
+
+async def fetch_link(
+    short_code: str, 
+    db: AsyncSession, 
+    redis_client: redis.Redis
+    ) -> CachedLink:
+    """Загружает ссылку из БД и кладет ее запись в Redis и L1.
+
+    Загрузку одного кода между воркерами координирует короткая блокировка
+    Redis: не получивший ее воркер ждет, пока ключ появится в кэше.
+    redis_client должен быть без decode_responses (get_binary_redis).
+    """
+    cache_key = f"{LINK_CACHE_PREFIX}{short_code}"
+    lock = redis_client.lock(f"lock:{cache_key}", timeout=CACHE_LOCK_TIMEOUT)
+    acquired = await lock.acquire(blocking=False)
+    if not acquired:
+        values = await wait_for_cache(
+            [cache_key, f"{NEGATIVE_CACHE_PREFIX}{short_code}"], 
+            CACHE_LOCK_WAIT, 
+            redis_client
+            )
+        if values:
+            if not values[0]:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Short link not found"
+                )
+            record, _ = await get_link_record(short_code, redis_client)
+            if record is not None:
+                return record
+        # Не дождались другого воркера - загружаем сами
+    try:
+        db_link = await load_link(short_code, db, redis_client, get_original_url)
+        if not db_link:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Short link not found"
+            )
+
+        if db_link.expires_at is not None and datetime.utcnow() > db_link.expires_at:
+            # Удалением истекших ссылок занимается фоновый sweeper
+            redirect_logger.info("Ссылка истекла", extra={"short_code": short_code, "expires_at": db_link.expires_at})
+            raise_link_expired()
+
+        # Ни Redis, ни L1 не должны пережить expires_at ссылки
+        return await cache_link_record(db_link, redis_client)
+    finally:
+        if acquired:
+            try:
+                await lock.release()
+            except LockError:
+                pass # блокировка уже истекла по таймауту
+
+refresh_tasks = set()
+
+async def refresh_link_cache(short_code: str):
+    """Заранее перезагружает ключ ссылки, пока он еще не истек."""
+    try:
+        async with database.async_session() as db:
+            await link_loads.do(
+                f"{LINK_CACHE_PREFIX}{short_code}",
+                lambda: fetch_link(short_code, db, cache.get_binary_client())
+            )
+    except Exception as e:
+        # Ключ просто доживет до своего TTL
+        redirect_logger.warning("Не удалось заранее обновить ссылку", extra={"short_code": short_code, "error": repr(e)})
+
+def schedule_link_refresh(short_code: str):
+    """Запускает раннее обновление ключа ссылки в фоне."""
+    task = asyncio.create_task(refresh_link_cache(short_code))
+    refresh_tasks.add(task)
+    task.add_done_callback(refresh_tasks.discard)
 
 @router.get(
         "/search",
@@ -26,7 +146,7 @@ STATS_CACHE_TTL = 300
 async def search_url(
     original_url: str, 
     db: AsyncSession = Depends(get_db), 
-    current_user: Optional[User] = Depends(get_current_user_optional)
+    current_user: Optional[CurrentUser] = Depends(get_current_user_optional)
     ):
     user_id = current_user.id if current_user else None
     db_link = await search_link_by_original_url(
@@ -44,54 +164,161 @@ async def search_url(
 async def shorten_url(
     link: LinkCreate, 
     db: AsyncSession = Depends(get_db), 
-    current_user: Optional[User] = Depends(get_current_user_optional)
+    current_user: Optional[CurrentUser] = Depends(get_current_user_optional),
+    redis_client: redis.Redis = Depends(get_redis)
     ):
     user_id = current_user.id if current_user else None
     db_link = await create_short_link(
         link=link, 
         user_id=user_id, 
-        db=db
+        db=db,
+        redis_client=redis_client
         )
+    await register_short_codes([db_link.short_code], redis_client)
     return db_link
 
-@router.get("/{short_code}")
-async def redirect_url(
-    short_code: str, 
-    db: AsyncSession = Depends(get_db),
+async def read_batch_links(request: Request) -> list[LinkCreate]:
+    """Читает пачку ссылок из JSON-массива или построчно из NDJSON потока."""
+    try:
+        if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+            links = []
+            buffer = b""
+            async for chunk in request.stream():
+                buffer += chunk
+                *lines, buffer = buffer.split(b"\n")
+                links.extend(LinkCreate.model_validate_json(line) for line in lines if line.strip())
+                if len(links) > LINK_BATCH_MAX_SIZE:
+                    break
+            if buffer.strip():
+                links.append(LinkCreate.model_validate_json(buffer))
+        else:
+            links = TypeAdapter(list[LinkCreate]).validate_json(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+    if len(links) > LINK_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch is limited to {LINK_BATCH_MAX_SIZE} links"
+        )
+    return links
+
+@router.post(
+        "/shorten/batch", 
+        status_code=status.HTTP_201_CREATED, 
+        response_model=BatchLinkResponse
+        )
+async def shorten_batch(
+    request: Request,
+    db: AsyncSession = Depends(get_db), 
+    current_user: Optional[CurrentUser] = Depends(get_current_user_optional),
     redis_client: redis.Redis = Depends(get_redis)
     ):
-
-    cache_key = f"{LINK_CACHE_PREFIX}{short_code}"
-    cached_url = await get_cache(cache_key, redis_client)
-    if cached_url:
-        print(f"Кэш HIT для {short_code}")
-        return RedirectResponse(cached_url, status_code=status.HTTP_302_FOUND)
-
-    db_link = await get_original_url(
-        short_code=short_code, 
+    links = await read_batch_links(request)
+    user_id = current_user.id if current_user else None
+    result = await create_short_links_batch(
+        links=links, 
+        user_id=user_id, 
         db=db
         )
-    if not db_link:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Short link not found"
+    await register_short_codes(
+        [item.short_code for item in result["results"] if item.status == "created"],
+        redis_client
         )
+    return result
 
-    if db_link.expires_at != "NULL" and datetime.utcnow() > db_link.expires_at:
-        print(f"Ссылка {short_code} истекла {db_link.expires_at}")
-
-        await db.delete(db_link)
-        await db.commit()
-        await delete_cache(cache_key, redis_client)
+@router.post(
+        "/resolve",
+        response_model=dict[str, ResolvedLink],
+        status_code=status.HTTP_200_OK
+        )
+async def resolve_batch(
+    body: ResolveRequest,
+    db: AsyncSession = Depends(get_db),
+    redis_client: redis.Redis = Depends(get_binary_redis)
+    ):
+    """Разрешает пачку коротких кодов: L1, один MGET, один запрос IN для промахов."""
+    short_codes = list(dict.fromkeys(body.short_codes))
+    if len(short_codes) > RESOLVE_BATCH_MAX_SIZE:
         raise HTTPException(
-            status_code=status.HTTP_410_GONE, 
-            detail="Short link has expired or does not exist"
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch is limited to {RESOLVE_BATCH_MAX_SIZE} short codes"
         )
-    
-    original_url_str = str(db_link.original_url)
-    await set_cache(cache_key, original_url_str, expire=3600, redis_client=redis_client) # Кэш на 1 час
+    records = {}
+    misses = []
+    for short_code in short_codes:
+        record = local_cache.get(f"{LINK_CACHE_PREFIX}{short_code}")
+        if record is not None:
+            records[short_code] = record
+        else:
+            misses.append(short_code)
+
+    if misses:
+        cached = await redis_client.mget([f"{LINK_CACHE_PREFIX}{short_code}" for short_code in misses])
+        db_misses = []
+        for short_code, data in zip(misses, cached):
+            record = unpack_link(data)
+            if record is not None:
+                records[short_code] = record
+            else:
+                db_misses.append(short_code)
+        misses = db_misses
+
+    if misses:
+        db_links = await get_links_by_short_codes(misses, db)
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for short_code, db_link in db_links.items():
+                record = link_record(db_link)
+                records[short_code] = record
+                if not record.is_expired():
+                    pipe.set(
+                        f"{LINK_CACHE_PREFIX}{short_code}", 
+                        pack_link(record), 
+                        ex=link_cache_ttl(record.expires_at, LINK_CACHE_TTL)
+                        )
+            await pipe.execute()
+
+    resolved = {}
+    for short_code in short_codes:
+        record = records.get(short_code)
+        if record is None:
+            resolved[short_code] = ResolvedLink(status="not_found")
+        elif record.is_expired():
+            resolved[short_code] = ResolvedLink(status="expired", expires_at=record.expires_at)
+        else:
+            resolved[short_code] = ResolvedLink(
+                status="ok",
+                original_url=record.url,
+                expires_at=record.expires_at
+            )
+    return resolved
+
+@router.get("/{short_code}")
+async def redirect_url(
+    short_code: str, 
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    redis_client: redis.Redis = Depends(get_binary_redis)
+    ):
+
+    with stage("redirect", "cache"):
+        record, ttl = await get_link_record(short_code, redis_client)
+    if record is not None:
+        if redirect_logger.isEnabledFor(logging.DEBUG):
+            redirect_logger.debug("Кэш HIT", extra={"short_code": short_code, "ttl": ttl})
+        if ttl is not None and should_refresh_early(ttl):
+            schedule_link_refresh(short_code)
+    else:
+        # Параллельные промахи по одному коду ждут одну загрузку из БД
+        with stage("redirect", "db_load"):
+            record = await link_loads.do(
+                f"{LINK_CACHE_PREFIX}{short_code}",
+                lambda: fetch_link(short_code, db, redis_client)
+            )
+    if record.is_expired():
+        raise_link_expired()
+    record_click(short_code, request)
     return RedirectResponse(
-        db_link.original_url, 
+        record.url, 
         status_code=status.HTTP_302_FOUND
         )
 
@@ -104,7 +331,8 @@ async def update_url(
     short_code: str, 
     original_url: str, 
     db: AsyncSession = Depends(get_db), 
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user),
+    redis_client: redis.Redis = Depends(get_redis)
     ):
     db_link = await update_link(
         short_code=short_code, 
@@ -117,6 +345,7 @@ async def update_url(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Short link not found"
         )
+    await link_updated(db_link, redis_client)
     return db_link
 
 @router.delete(
@@ -126,54 +355,64 @@ async def update_url(
 async def delete_url(
     short_code: str, 
     db: AsyncSession = Depends(get_db), 
-    current_user: User = Depends(get_current_user)
+    current_user: CurrentUser = Depends(get_current_user),
+    redis_client: redis.Redis = Depends(get_redis)
     ):
-    return await delete_link(
+    result = await delete_link(
         short_code=short_code, 
         db=db, 
         user_id=current_user.id
         )
+    await link_deleted(short_code, redis_client)
+    return result
 
 
 @router.get(
         "/{short_code}/stats", 
-        response_model=LinkInfo,
+        response_model=LinkStatsInfo,
         status_code= status.HTTP_200_OK
         )
 async def get_info(
     short_code: str, 
     db:AsyncSession = Depends(get_db),
-    redis_client: redis.Redis = Depends(get_redis)
+    redis_client: redis.Redis = Depends(get_redis),
+    binary_client: redis.Redis = Depends(get_binary_redis)
     ):
-    cache_key = f"{STATS_CACHE_PREFIX}{short_code}"
-
-    cached_stats = await get_cache(cache_key, redis_client)
-    if cached_stats:
-        print(f"Кэш HIT для {short_code}")
-        response_object = LinkInfo.model_validate_json(cached_stats)
-        return response_object
+    # Та же запись link:, что и у редиректа; вместе со счетчиками - один запрос к Redis
+    with stage("stats", "cache"):
+        async with cache_pipeline(binary_client, name="stats:") as batch:
+            cached = queue_link_record(batch, short_code)
+            counters = queue_click_stats(batch, short_code)
+        record, ttl = cached.value
+    if record is not None:
+        if stats_logger.isEnabledFor(logging.DEBUG):
+            stats_logger.debug("Кэш HIT", extra={"short_code": short_code, "ttl": ttl})
+        link_info = LinkInfo(
+            short_code= short_code,
+            original_url= record.url,
+            created_at= record.created_at,
+            expires_at= record.expires_at
+        )
+        return LinkStatsInfo(**link_info.model_dump(), **counters.value)
     
     
-    db_link = await get_link_info(
-        short_code=short_code, 
-        db=db
-        )
+    with stage("stats", "db_load"):
+        db_link = await load_link(short_code, db, redis_client, get_link_info)
     if not db_link:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Short link not found"
         )
     
-    stats_to_cache = LinkInfo(
+    link_info = LinkInfo(
         short_code= db_link.short_code,
         original_url= db_link.original_url,
         created_at= db_link.created_at,
         expires_at= db_link.expires_at
     )
-    stats_to_cache = stats_to_cache.json()
-    await set_cache(
-        cache_key,
-        stats_to_cache, 
-        expire=STATS_CACHE_TTL, 
-        redis_client=redis_client)
-    return db_link
\ No newline at end of file
+    # Истекшие ссылки /stats отдает, но в кэш не кладет
+    if db_link.expires_at is None or datetime.utcnow() <= db_link.expires_at:
+        await cache_link_record(db_link, binary_client)
+    with stage("stats", "clicks"):
+        click_stats = await get_click_stats(short_code, redis_client)
+    return LinkStatsInfo(**link_info.model_dump(), **click_stats)
@@ -0,0 +1,31 @@
+from fastapi import APIRouter, Response
+from src.metrics import registry
+from src.cache import local_cache, link_loads
+from src.auth import user_cache
+from src.clicks import click_writer
+from src.database import LazySession
+from src.hashing import password_hasher
+
+router = APIRouter(
+    tags= ["metrics"]
+)
+
+component_stats = registry.gauge(
+    "app_component_stat", "Внутренние счетчики компонентов (stats())", ("component", "stat")
+)
+
+def _register_component(component: str, stats):
+    for stat in stats():
+        component_stats.set_function(lambda stat=stat: stats()[stat], component=component, stat=stat)
+
+_register_component("l1_link_cache", local_cache.stats)
+_register_component("user_cache", user_cache.stats)
+_register_component("link_single_flight", link_loads.stats)
+_register_component("click_writer", click_writer.stats)
+_register_component("db_session", LazySession.stats)
+_register_component("password_hasher", password_hasher.stats)
+
+@router.get("/metrics")
+async def metrics():
+    """Метрики в текстовом формате Prometheus."""
+    return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
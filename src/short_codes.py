@@ -0,0 +1,96 @@
+from src.config import SHORT_CODE_LENGTH, SHORT_CODE_SECRET
+import src.utils as utils
+import hashlib
+
+FEISTEL_ROUNDS = 4
+MASK64 = (1 << 64) - 1
+
+class ShortCodeCodec:
+    """Обратимо переводит значение счетчика в короткий код фиксированной длины.
+
+    Значение проходит Feistel-перестановку пространства [0, 62^length) с ключом
+    secret и кодируется в Base62 с дополнением нулями. Соседние значения
+    счетчика дают несвязанные коды, поэтому по коду нельзя узнать порядок
+    ссылок и перебрать их, а вставки не идут в конец индекса. decode
+    восстанавливает значение счетчика без обращения к БД.
+    """
+
+    def __init__(
+            self,
+            length: int = SHORT_CODE_LENGTH,
+            secret: str = SHORT_CODE_SECRET,
+            rounds: int = FEISTEL_ROUNDS
+            ):
+        if length < 1:
+            raise ValueError("Short code length must be positive")
+        # Без ключа перестановка известна всем и коды декодируются в id подряд
+        if not secret:
+            raise ValueError("SHORT_CODE_SECRET must be set")
+        self.length = length
+        self.domain = utils.BASE ** length
+        # Feistel работает на 2 * half_bits битах, лишние значения пропускаются (cycle walking)
+        self.half_bits = ((self.domain - 1).bit_length() + 1) // 2
+        self.mask = (1 << self.half_bits) - 1
+        # Отпечаток настроек без самого ключа: по нему миграции видят, что коды выдавались с другими
+        self.fingerprint = hashlib.blake2b(f"{length}:{secret}".encode("utf-8"), digest_size=16).hexdigest()
+        # Ключи раундов выводятся из secret один раз, сама функция раунда - целочисленная
+        self.keys = [
+            int.from_bytes(hashlib.blake2b(f"{secret}:{i}".encode("utf-8"), digest_size=8).digest(), "big")
+            for i in range(rounds)
+        ]
+
+    def _round(self, key: int, value: int) -> int:
+        # Финализатор splitmix64 от значения, смешанного с ключом раунда
+        value = ((value ^ key) * 0x9E3779B97F4A7C15) & MASK64
+        value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+        value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & MASK64
+        return (value ^ (value >> 31)) & self.mask
+
+    def _forward(self, value: int) -> int:
+        left, right = value >> self.half_bits, value & self.mask
+        for key in self.keys:
+            left, right = right, left ^ self._round(key, right)
+        return (left << self.half_bits) | right
+
+    def _backward(self, value: int) -> int:
+        left, right = value >> self.half_bits, value & self.mask
+        for key in reversed(self.keys):
+            left, right = right ^ self._round(key, left), left
+        return (left << self.half_bits) | right
+
+    def permute(self, num: int) -> int:
+        """Биекция [0, domain) -> [0, domain)."""
+        if not 0 <= num < self.domain:
+            raise ValueError(f"Counter value {num} does not fit {self.length}-character short codes")
+        num = self._forward(num)
+        while num >= self.domain:
+            num = self._forward(num)
+        return num
+
+    def unpermute(self, num: int) -> int:
+        """Обратная к permute."""
+        if not 0 <= num < self.domain:
+            raise ValueError(f"Value {num} is outside of the short code space")
+        num = self._backward(num)
+        while num >= self.domain:
+            num = self._backward(num)
+        return num
+
+    def encode(self, num: int) -> str:
+        """Возвращает короткий код ровно из length символов."""
+        return utils.encode(self.permute(num)).rjust(self.length, utils.ALPHABET[0])
+
+    def encode_many(self, nums) -> list[str]:
+        """Кодирует пачку значений счетчика."""
+        return [
+            code.rjust(self.length, utils.ALPHABET[0])
+            for code in utils.encode_many([self.permute(num) for num in nums])
+        ]
+
+    def decode(self, code: str) -> int | None:
+        """Восстанавливает значение счетчика; для строк, которые не могли быть выданы, возвращает None."""
+        if not utils.is_base62(code) or len(code) != self.length:
+            return None
+        return self.unpermute(utils.decode(code))
+
+short_codes = ShortCodeCodec()
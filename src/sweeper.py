@@ -0,0 +1,65 @@
+from sqlalchemy import select, delete
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from src.database import Link, LinkAlias, LinkStats
+from src.config import EXPIRY_SWEEP_INTERVAL, EXPIRY_SWEEP_BATCH, BLOOM_CHECK_INTERVAL
+from src.coherence import queue_link_removal
+from src.bloom import short_code_filter
+import src.database as database
+import src.cache as cache
+from datetime import datetime
+from src.logs import get_logger
+
+logger = get_logger("sweeper")
+
+async def sweep_expired_links(batch_size: int = EXPIRY_SWEEP_BATCH):
+    """Удаляет истекшие ссылки пачками по индексу expires_at и чистит их ключи в Redis."""
+    deleted = 0
+    while True:
+        async with database.async_session() as db:
+            result = await db.execute(
+                select(Link.id, Link.short_code)
+                .where(Link.expires_at < datetime.utcnow())
+                .order_by(Link.expires_at)
+                .limit(batch_size)
+            )
+            expired = result.all()
+            if not expired:
+                break
+            link_ids = [link_id for link_id, _ in expired]
+            await db.execute(delete(LinkStats).where(LinkStats.link_id.in_(link_ids)))
+            await db.execute(delete(LinkAlias).where(LinkAlias.link_id.in_(link_ids)))
+            await db.execute(delete(Link).where(Link.id.in_(link_ids)))
+            await db.commit()
+
+        async with cache.get_client().pipeline(transaction=False) as pipe:
+            for _, short_code in expired:
+                queue_link_removal(pipe, short_code)
+            await pipe.execute()
+
+        deleted += len(expired)
+        if len(expired) < batch_size:
+            break
+    if deleted:
+        logger.info("Удалены истекшие ссылки", extra={"deleted": deleted})
+    return deleted
+
+def create_scheduler():
+    """Создает планировщик с периодической очисткой истекших ссылок и проверкой Bloom-фильтра."""
+    scheduler = AsyncIOScheduler()
+    # Строим фильтр сразу при старте и перестраиваем, если Redis его потерял
+    scheduler.add_job(
+        short_code_filter.build,
+        "interval",
+        seconds=BLOOM_CHECK_INTERVAL,
+        next_run_time=datetime.now(),
+        max_instances=1,
+        coalesce=True
+    )
+    scheduler.add_job(
+        sweep_expired_links,
+        "interval",
+        seconds=EXPIRY_SWEEP_INTERVAL,
+        max_instances=1,
+        coalesce=True
+    )
+    return scheduler
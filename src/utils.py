@@ -1,22 +1,135 @@
 import string
+import hashlib
+import re
+from urllib.parse import urlsplit, urlunsplit
+
+try:
+    import numpy as np
+except ImportError: # numpy нужен только для пакетной обработки массивов
+    np = None
 
 ALPHABET = string.digits + string.ascii_lowercase + string.ascii_uppercase
 
 BASE = len(ALPHABET)
 
+# Обратная таблица символ -> цифра вместо ALPHABET.index (O(62) на символ)
+DECODE_MAP = {char: value for value, char in enumerate(ALPHABET)}
+# Пары цифр: encode делит на 62^2 и вдвое сокращает число итераций
+PAIRS = [a + b for a in ALPHABET for b in ALPHABET]
+PAIR_BASE = BASE * BASE
+BASE62_RE = re.compile(r"[0-9a-zA-Z]+")
+# Больше 10 цифр Base62 не помещается в int64
+ARRAY_MAX_LENGTH = 10
+
 def encode(num):
-    """Преобразует положительное число в Base62"""
-    if num == 0:
-        return ALPHABET[0]
+    """Преобразует неотрицательное целое число в Base62"""
+    if not isinstance(num, int) or isinstance(num, bool):
+        raise TypeError(f"Base62 encodes integers, got {type(num).__name__}")
+    if num < 0:
+        raise ValueError("Base62 encodes non-negative integers only")
+    if num < BASE:
+        return ALPHABET[num]
     arr = []
-    while num:
-        num, rem = divmod(num, BASE)
-        arr.append(ALPHABET[rem])
+    while num >= PAIR_BASE:
+        num, rem = divmod(num, PAIR_BASE)
+        arr.append(PAIRS[rem])
+    arr.append(PAIRS[num] if num >= BASE else ALPHABET[num])
     return ''.join(reversed(arr))
 
 def decode(string):
     """Преобразует Base62 строку в число"""
+    if not string:
+        raise ValueError("Empty Base62 string")
     res = 0
-    for char in string:
-        res = res * BASE + ALPHABET.index(char)
+    try:
+        for char in string:
+            res = res * BASE + DECODE_MAP[char]
+    except KeyError:
+        raise ValueError(f"Invalid Base62 character: {char!r}") from None
     return res
+
+def is_base62(string, max_length=None):
+    """Проверяет, что строка непустая, состоит из символов Base62 и не длиннее max_length"""
+    if not isinstance(string, str) or (max_length is not None and len(string) > max_length):
+        return False
+    return BASE62_RE.fullmatch(string) is not None
+
+def encode_many(nums):
+    """Кодирует последовательность чисел; массивы numpy обрабатываются векторно"""
+    if np is not None and isinstance(nums, np.ndarray):
+        return _encode_array(nums)
+    return [encode(num) for num in nums]
+
+def decode_many(codes, as_array=False):
+    """Декодирует последовательность строк; с as_array возвращает массив numpy int64"""
+    if not as_array:
+        return [decode(code) for code in codes]
+    if np is None:
+        raise RuntimeError("decode_many(as_array=True) requires numpy")
+    return _decode_array(list(codes))
+
+def _encode_array(nums):
+    if nums.size == 0:
+        return []
+    if nums.dtype.kind not in "iu":
+        raise TypeError(f"Base62 encodes integers, got array of {nums.dtype}")
+    if nums.min() < 0:
+        raise ValueError("Base62 encodes non-negative integers only")
+    nums = nums.astype(np.uint64).ravel()
+    width = len(encode(int(nums.max())))
+    alphabet = np.frombuffer(ALPHABET.encode("ascii"), dtype=np.uint8)
+    digits = np.empty((nums.size, width), dtype=np.uint8)
+    for position in range(width - 1, -1, -1):
+        digits[:, position] = alphabet[nums % BASE]
+        nums = nums // BASE
+    # Ведущие нули дополнения отрезаются, сам ноль остается "0"
+    rows = digits.view(f"S{width}").ravel()
+    return [row.decode("ascii").lstrip("0") or "0" for row in rows]
+
+def _decode_array(codes):
+    if not codes:
+        return np.empty(0, dtype=np.int64)
+    lengths = np.fromiter(map(len, codes), dtype=np.int64, count=len(codes))
+    if lengths.min() == 0:
+        raise ValueError("Empty Base62 string")
+    if lengths.max() > ARRAY_MAX_LENGTH:
+        return np.array(decode_many(codes), dtype=object)
+    try:
+        chars = np.array(codes, dtype=f"S{lengths.max()}")
+    except UnicodeEncodeError:
+        raise ValueError("Invalid Base62 character") from None
+    table = np.full(256, -1, dtype=np.int64)
+    table[np.frombuffer(ALPHABET.encode("ascii"), dtype=np.uint8)] = np.arange(BASE)
+    values = table[chars.view(np.uint8).reshape(len(codes), -1)]
+    # Короткие строки дополнены справа нулевыми байтами - их не учитываем
+    inside = np.arange(values.shape[1]) < lengths[:, None]
+    if (values[inside] < 0).any():
+        raise ValueError("Invalid Base62 character")
+    res = np.zeros(len(codes), dtype=np.int64)
+    for position in range(values.shape[1]):
+        column = inside[:, position]
+        res[column] = res[column] * BASE + values[column, position]
+    return res
+
+DEFAULT_PORTS = {"http": ":80", "https": ":443"}
+
+def normalize_url(url):
+    """Приводит URL к каноническому виду: регистр схемы и хоста, порт по умолчанию.
+
+    Фрагмент сохраняется: в SPA (#/page1, #/page2) он выбирает страницу.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    default_port = DEFAULT_PORTS.get(scheme)
+    if default_port and netloc.endswith(default_port):
+        netloc = netloc[:-len(default_port)]
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, parts.fragment))
+
+def same_url(original_url, normalized_url):
+    """Подтверждает совпадение по хешу сравнением самих нормализованных URL"""
+    return original_url is not None and normalize_url(original_url) == normalized_url
+
+def url_hash(url):
+    """Хеш нормализованного URL фиксированной длины (64 hex символа) для индекса"""
+    return hashlib.sha256(normalize_url(url).encode("utf-8")).hexdigest()
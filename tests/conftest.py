@@ -1,15 +1,21 @@
 import pytest
 import asyncio
+import os
 from httpx import AsyncClient
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import NullPool 
+from sqlalchemy.pool import NullPool, StaticPool
 from main import app
 from src.database import Base, get_db
 
-TEST_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
+# Для прогона на Postgres: TEST_DATABASE_URL=postgresql+asyncpg://...
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "sqlite+aiosqlite:///:memory:")
 
-engine = create_async_engine(TEST_DATABASE_URL, poolclass=NullPool)
+# Каждое соединение с sqlite :memory: - отдельная пустая база, поэтому держим одно общее
+engine = create_async_engine(
+    TEST_DATABASE_URL,
+    poolclass=StaticPool if TEST_DATABASE_URL.endswith(":memory:") else NullPool
+)
 
 async_session = sessionmaker(
     engine, expire_on_commit=False, class_=AsyncSession
@@ -30,8 +36,9 @@ async def init_db():
         await conn.run_sync(Base.metadata.drop_all)
 
 @pytest.fixture()
-async def test_db():
-    yield
+async def test_db(init_db):
+    async with async_session() as db:
+        yield db
 
 
 
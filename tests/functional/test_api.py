@@ -1,9 +1,12 @@
 import pytest
+import asyncio
 from fastapi import status
 from src.models import UserCreate, UserInfo
 from src.models import LinkInfo
 from pydantic import HttpUrl
 from datetime import datetime, timedelta
+from src.sweeper import sweep_expired_links
+from src.short_codes import short_codes
 
 @pytest.mark.asyncio
 async def test_read_main(client):
@@ -85,6 +88,20 @@ async def test_search(client):
 
     assert response.status_code == status.HTTP_200_OK
 
+@pytest.mark.asyncio
+async def test_search_keeps_fragment(client):
+    """Ссылки, отличающиеся только фрагментом, находятся каждая по своему URL."""
+    codes = {}
+    for page in ("page1", "page2"):
+        url = f"https://spa.example.com/#/{page}"
+        response = await client.post("links/shorten", json= {"original_url": url})
+        codes[url] = response.json()["short_code"]
+
+    for url, short_code in codes.items():
+        response = await client.get("links/search", params= {"original_url": url})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["Your short link"] == short_code
+
 @pytest.mark.asyncio
 async def test_redirect_success(
     client
@@ -182,3 +199,393 @@ async def delete_success(
         )
     
     assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.asyncio
+async def test_stats_click_counters(
+    client
+    ):
+    """Переходы попадают в предагрегированные счетчики статистики."""
+    short_code = "short"
+    await client.get(
+        f"links/{short_code}", 
+        follow_redirects=False
+        )
+    await asyncio.sleep(2) # Клики пишутся фоновой задачей пачками
+    response = await client.get(f"links/{short_code}/stats")
+
+    assert response.status_code == status.HTTP_200_OK
+    response_data = response.json()
+    assert response_data["clicks"] >= 1
+    assert response_data["last_accessed_at"] is not None
+    assert sum(response_data["clicks_by_day"].values()) == response_data["clicks"]
+
+
+@pytest.mark.asyncio
+async def test_shorten_batch(
+    client
+    ):
+    """Пачка ссылок создается одним запросом, занятые alias возвращаются как конфликты."""
+    data = [
+        {"original_url": "https://example.com/1"},
+        {"original_url": "https://example.com/2", "custom_alias": "short"},
+        {"original_url": "https://example.com/3", "custom_alias": "batch_alias"},
+        {"original_url": "https://example.com/4", "custom_alias": "batch_alias"},
+    ]
+    response = await client.post(
+        "links/shorten/batch",
+        json= data
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+
+    response_data = response.json()
+    assert response_data["created"] == 2
+    assert response_data["conflicts"] == ["short", "batch_alias"]
+    statuses = [item["status"] for item in response_data["results"]]
+    assert statuses == ["created", "conflict", "created", "conflict"]
+
+    response = await client.get(
+        "links/batch_alias", 
+        follow_redirects=False
+        )
+    assert response.headers["location"] == data[2]["original_url"]
+
+@pytest.mark.asyncio
+async def test_generated_short_codes(
+    client
+    ):
+    """Сгенерированные коды фиксированной длины и декодируются в разные значения счетчика."""
+    codes = []
+    for i in range(3):
+        response = await client.post(
+            "links/shorten",
+            json={"original_url": f"https://example.com/generated/{i}"}
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        codes.append(response.json()["short_code"])
+    response = await client.post(
+        "links/shorten/batch",
+        json=[{"original_url": f"https://example.com/generated/batch/{i}"} for i in range(3)]
+    )
+    codes.extend(item["short_code"] for item in response.json()["results"])
+
+    assert all(len(code) == short_codes.length for code in codes)
+    counters = [short_codes.decode(code) for code in codes]
+    assert None not in counters
+    assert len(set(counters)) == len(codes)
+
+@pytest.mark.asyncio
+async def test_custom_alias_table(
+    client
+    ):
+    """Alias хранятся отдельно от сгенерированных кодов и освобождаются при удалении ссылки."""
+    generated_like = "A" * short_codes.length
+    response = await client.post(
+        "links/shorten",
+        json={"original_url": "https://example.com/alias", "custom_alias": generated_like}
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    response = await client.post(
+        "links/shorten/batch",
+        json=[{"original_url": "https://example.com/alias", "custom_alias": generated_like}]
+    )
+    assert response.json()["conflicts"] == [generated_like]
+
+    token = await test_login_success(client= client)
+    headers = {"Authorization": f"Bearer {token}"}
+    for url in ["https://example.com/alias/1", "https://example.com/alias/2"]:
+        response = await client.post(
+            "links/shorten",
+            json={"original_url": url, "custom_alias": "reused_alias"},
+            headers=headers
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        response = await client.get("links/reused_alias", follow_redirects=False)
+        assert response.headers["location"] == url
+        response = await client.delete("links/reused_alias", headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+
+@pytest.mark.asyncio
+async def test_shorten_batch_ndjson(
+    client
+    ):
+    """Пачка ссылок принимается потоком NDJSON."""
+    body = "\n".join([
+        '{"original_url": "https://example.com/ndjson/1"}',
+        '{"original_url": "https://example.com/ndjson/2"}',
+    ])
+    response = await client.post(
+        "links/shorten/batch",
+        content= body,
+        headers={"Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.json()["created"] == 2
+
+    response = await client.post(
+        "links/shorten/batch",
+        content= '{"custom_alias": "no_url"}',
+        headers={"Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.asyncio
+async def test_resolve_batch(
+    client
+    ):
+    """Пачка коротких кодов разрешается одним запросом."""
+    expires_at_str = (datetime.utcnow() - timedelta(minutes=1)).isoformat()
+    response = await client.post(
+        "links/shorten",
+        json= {
+            "original_url": "https://expired.example.com/",
+            "custom_alias": "expired_link",
+            "expires_at": expires_at_str
+        }
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+
+    response = await client.post(
+        "links/resolve",
+        json= {"short_codes": ["short", "expired_link", "missing_code", "short"]}
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+    response_data = response.json()
+    assert list(response_data) == ["short", "expired_link", "missing_code"]
+    assert response_data["short"]["status"] == "ok"
+    assert response_data["short"]["original_url"] == "https://mail.ru/"
+    assert response_data["expired_link"]["status"] == "expired"
+    assert response_data["missing_code"]["status"] == "not_found"
+
+
+@pytest.mark.asyncio
+async def test_sweep_expired_links(
+    client
+    ):
+    """Фоновая очистка удаляет истекшие ссылки, не трогая действующие."""
+    deleted = await sweep_expired_links()
+    assert deleted >= 1
+
+    response = await client.post(
+        "links/resolve",
+        json= {"short_codes": ["short", "expired_link"]}
+    )
+    response_data = response.json()
+    assert response_data["short"]["status"] == "ok"
+    assert response_data["expired_link"]["status"] == "not_found"
+
+
+@pytest.mark.asyncio
+async def test_negative_cache_cleared_on_create(
+    client
+    ):
+    """Несуществующий код отдает 404, а после создания ссылки сразу редиректит."""
+    short_code = "later_alias"
+    for _ in range(2): # второй запрос обслуживается негативным кэшем
+        response = await client.get(
+            f"links/{short_code}", 
+            follow_redirects=False
+            )
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    response = await client.post(
+        "links/shorten",
+        json= {"original_url": "https://later.example.com/", "custom_alias": short_code}
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+
+    response = await client.get(
+        f"links/{short_code}", 
+        follow_redirects=False
+        )
+    assert response.status_code == status.HTTP_302_FOUND
+    assert response.headers["location"] == "https://later.example.com/"
+
+
+@pytest.mark.asyncio
+async def test_revoke_tokens(
+    client
+    ):
+    """После отзыва старый токен отклоняется, а новый после входа работает."""
+    token = await test_login_success(client= client)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = await client.post("auth/revoke", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+
+    response = await client.put(
+        "links/oldurl",
+        params={"original_url": "https://revoked.example.com"},
+        headers=headers
+        )
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    new_token = await test_login_success(client= client)
+    response = await client.put(
+        "links/oldurl",
+        params={"original_url": "https://newurl.com"},
+        headers={"Authorization": f"Bearer {new_token}"}
+        )
+    assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.asyncio
+async def test_shorten_dedupe(
+    client
+    ):
+    """Параллельные одинаковые запросы с dedupe получают одну и ту же ссылку."""
+    data = {"original_url": "https://dedupe.example.com/page", "dedupe": True}
+    responses = await asyncio.gather(*[
+        client.post("links/shorten", json= data) for _ in range(5)
+    ])
+    assert all(r.status_code == status.HTTP_201_CREATED for r in responses)
+    assert len({r.json()["short_code"] for r in responses}) == 1
+
+    response = await client.post(
+        "links/shorten",
+        json= {"original_url": "https://DEDUPE.example.com:443/page", "dedupe": True}
+    )
+    assert response.json()["short_code"] == responses[0].json()["short_code"]
+
+    response = await client.post(
+        "links/shorten",
+        json= {"original_url": "https://dedupe.example.com/page#section", "dedupe": True}
+    )
+    assert response.json()["short_code"] != responses[0].json()["short_code"]
+
+    response = await client.post(
+        "links/shorten",
+        json= {"original_url": "https://dedupe.example.com/page"}
+    )
+    assert response.json()["short_code"] != responses[0].json()["short_code"]
+
+
+@pytest.mark.asyncio
+async def test_shorten_dedupe_keeps_fragment(
+    client
+    ):
+    """Страницы SPA с разными фрагментами не склеиваются при дедупликации."""
+    codes = set()
+    for page in ("page1", "page2", "page1"):
+        response = await client.post(
+            "links/shorten",
+            json= {"original_url": f"https://app.example.com/#/{page}", "dedupe": True}
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        codes.add(response.json()["short_code"])
+        response = await client.get(f"links/{response.json()['short_code']}", follow_redirects=False)
+        assert response.headers["location"] == f"https://app.example.com/#/{page}"
+    assert len(codes) == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_redirect_cache_miss(
+    client
+    ):
+    """Параллельные редиректы по некэшированной ссылке все получают 302."""
+    response = await client.post(
+        "links/shorten",
+        json= {"original_url": "https://stampede.example.com/"}
+    )
+    short_code = response.json()["short_code"]
+    responses = await asyncio.gather(*[
+        client.get(f"links/{short_code}", follow_redirects=False) for _ in range(10)
+    ])
+    assert all(r.status_code == status.HTTP_302_FOUND for r in responses)
+    assert all(r.headers["location"] == "https://stampede.example.com/" for r in responses)
+
+
+@pytest.mark.asyncio
+async def test_update_and_delete_refresh_cache(
+    client
+    ):
+    """После изменения и удаления ссылки редирект и статистика не отдают устаревший кэш."""
+    token = await test_login_success(client= client)
+    headers = {"Authorization": f"Bearer {token}"}
+    response = await client.post(
+        "links/shorten",
+        json= {"original_url": "https://before.example.com/", "custom_alias": "coherent"},
+        headers=headers
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+
+    response = await client.get("links/coherent", follow_redirects=False)
+    assert response.headers["location"] == "https://before.example.com/"
+    response = await client.get("links/coherent/stats")
+    assert response.json()["original_url"] == "https://before.example.com/"
+
+    response = await client.put(
+        "links/coherent",
+        params={"original_url": "https://after.example.com/"},
+        headers=headers
+        )
+    assert response.status_code == status.HTTP_200_OK
+
+    response = await client.get("links/coherent", follow_redirects=False)
+    assert response.headers["location"] == "https://after.example.com/"
+    response = await client.get("links/coherent/stats")
+    assert response.json()["original_url"] == "https://after.example.com/"
+
+    response = await client.delete("links/coherent", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+
+    response = await client.get("links/coherent", follow_redirects=False)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    response = await client.get("links/coherent/stats")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.asyncio
+async def test_redirect_fast_path(
+    client
+    ):
+    """Закэшированный редирект отдается напрямую, а запросы с Origin идут через CORS."""
+    response = await client.post(
+        "links/shorten",
+        json= {"original_url": "https://fast.example.com/path?q=1"}
+    )
+    short_code = response.json()["short_code"]
+
+    for _ in range(2): # первый запрос заполняет кэш, второй обслуживается из него
+        response = await client.get(f"links/{short_code}", follow_redirects=False)
+        assert response.status_code == status.HTTP_302_FOUND
+        assert response.headers["location"] == "https://fast.example.com/path?q=1"
+    assert "access-control-allow-origin" not in response.headers
+
+    response = await client.get(
+        f"links/{short_code}", 
+        headers={"Origin": "https://app.example.com"},
+        follow_redirects=False
+        )
+    assert response.status_code == status.HTTP_302_FOUND
+    assert "access-control-allow-origin" in response.headers
+
+    response = await client.get("links/search", params={"original_url": "https://fast.example.com/path?q=1"})
+    assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.asyncio
+async def test_metrics(
+    client
+    ):
+    """/metrics отдает гистограммы запросов, этапов, кэша и БД в формате Prometheus."""
+    response = await client.post(
+        "links/shorten",
+        json= {"original_url": "https://metrics.example.com/"}
+    )
+    short_code = response.json()["short_code"]
+    await client.get(f"links/{short_code}", follow_redirects=False)
+    await client.get(f"links/{short_code}/stats")
+
+    response = await client.get("metrics")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'http_request_duration_seconds_count{method="POST",route="/links/shorten",status="201"}' in body
+    assert 'request_stage_duration_seconds_bucket{route="redirect",stage="cache",le="+Inf"}' in body
+    assert 'cache_requests_total{tier="redis",prefix="link:",result="miss"}' in body
+    assert "db_query_duration_seconds_count" in body
+    assert "db_pool_checkout_wait_seconds_count" in body
+    assert 'app_component_stat{component="db_session",stat="unused"}' in body
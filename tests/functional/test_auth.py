@@ -0,0 +1,49 @@
+import pytest
+import uuid
+import redis.asyncio as redis
+from src.auth import CurrentUser, create_jwt_token, get_token_version, get_user_from_token, user_cache
+from src.config import REDIS_HOST, REDIS_PORT
+from src.database import User
+
+redis_pool = redis.ConnectionPool(host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=True)
+
+@pytest.mark.asyncio
+async def test_user_cache_survives_session_rollback(test_db):
+    """В кэше лежит снимок пользователя: откат сессии, загрузившей его, не ломает следующие запросы."""
+    username = f"cache_{uuid.uuid4().hex[:12]}"
+    db_user = User(username=username, hashed_password="x")
+    test_db.add(db_user)
+    await test_db.commit()
+    user_id = db_user.id
+
+    async with redis.Redis(connection_pool=redis_pool) as redis_client:
+        # Redis общий с запущенным сервером: у пользователя с тем же id токены могли отзываться
+        token = create_jwt_token(username, user_id, await get_token_version(user_id, redis_client))
+        user = await get_user_from_token(token, test_db, redis_client)
+        await test_db.rollback()
+        test_db.expunge_all()
+        assert user == CurrentUser(user_id, username)
+
+        cached = await get_user_from_token(token, test_db, redis_client)
+        assert cached.id == user_id
+    user_cache.delete(username)
+
+@pytest.mark.asyncio
+async def test_user_cache_checks_token_uid(test_db):
+    """Снимок в кэше по имени не подходит токену с другим uid."""
+    username = f"reused_{uuid.uuid4().hex[:12]}"
+    db_user = User(username=username, hashed_password="x")
+    test_db.add(db_user)
+    await test_db.commit()
+    user_id = db_user.id
+
+    async with redis.Redis(connection_pool=redis_pool) as redis_client:
+        stale_token = create_jwt_token(username, user_id + 1000)
+        user_cache.set(username, CurrentUser(user_id + 1000, username))
+        token = create_jwt_token(username, user_id, await get_token_version(user_id, redis_client))
+        user = await get_user_from_token(token, test_db, redis_client)
+        assert user == CurrentUser(user_id, username)
+
+        user_cache.set(username, CurrentUser(user_id, username))
+        assert await get_user_from_token(stale_token, test_db, redis_client) is None
+    user_cache.delete(username)
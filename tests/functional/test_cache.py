@@ -1,8 +1,13 @@
 import pytest
-from src.cache import set_cache, get_cache, delete_cache
+from src.cache import set_cache, get_cache, delete_cache, LocalCache, link_cache_ttl, SingleFlight, should_refresh_early
+from src.cache import cache_pipeline, get_client, get_binary_client
+from datetime import datetime, timedelta
 import asyncio
-from src.config import REDIS_HOST, REDIS_PORT
+import time
+from src.config import REDIS_HOST, REDIS_PORT, REDIS_MAX_CONNECTIONS, REDIS_SOCKET_TIMEOUT, REDIS_RETRY_ATTEMPTS
 import redis.asyncio as redis
+import msgpack
+from src.records import CachedLink, pack_link, unpack_link
 
 redis_pool = redis.ConnectionPool(host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=True)
 
@@ -71,4 +76,156 @@ async def test_set_cache_parametrized(key, value):
     async with redis.Redis(connection_pool=redis_pool) as client:
         await set_cache(key, value, redis_client=client)
         cached_value = await get_cache(key, redis_client=client)
-        assert cached_value == value
\ No newline at end of file
+        assert cached_value == value
+
+def test_local_cache_lru_eviction():
+    """L1 кэш вытесняет давно не использованные ключи при переполнении."""
+    cache = LocalCache(maxsize=2, ttl=60)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+
+def test_local_cache_ttl():
+    """Запись L1 кэша истекает по собственному TTL."""
+    cache = LocalCache(maxsize=10, ttl=60)
+    cache.set("a", "1", ttl=0.1)
+    assert cache.get("a") == "1"
+    time.sleep(0.2)
+    assert cache.get("a") is None
+    cache.set("b", "2", ttl=-5)
+    assert cache.get("b") is None
+
+def test_local_cache_source_ttl():
+    """L1 помнит срок ключа в Redis, чтобы раннее обновление работало и на попаданиях в L1."""
+    cache = LocalCache(maxsize=10, ttl=60)
+    cache.set("a", "1", ttl=600, source_ttl=600)
+    value, ttl = cache.get_with_ttl("a")
+    assert value == "1"
+    assert 599 < ttl <= 600
+    cache.set("b", "2")
+    assert cache.get_with_ttl("b") == ("2", None)
+    assert cache.get_with_ttl("missing") == (None, None)
+
+def test_local_cache_counters():
+    """Счетчики попаданий и промахов L1 кэша."""
+    cache = LocalCache(maxsize=10, ttl=60)
+    cache.set("a", "1")
+    cache.get("a")
+    cache.get("missing")
+    assert cache.stats() == {"size": 1, "maxsize": 10, "hits": 1, "misses": 1}
+
+
+def test_link_cache_ttl_capped_by_expiry():
+    """TTL ключа ссылки не превышает оставшееся время жизни ссылки."""
+    assert link_cache_ttl(None, 3600) == 3600
+    soon = datetime.utcnow() + timedelta(seconds=100)
+    assert 98 <= link_cache_ttl(soon, 3600) <= 100
+    later = datetime.utcnow() + timedelta(days=1)
+    assert link_cache_ttl(later, 3600) == 3600
+    assert link_cache_ttl(datetime.utcnow() - timedelta(seconds=5), 3600) == 1
+
+
+@pytest.mark.asyncio
+async def test_single_flight_coalesces_loads():
+    """Параллельные загрузки одного ключа выполняются один раз."""
+    flight = SingleFlight()
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "value"
+
+    results = await asyncio.gather(*[flight.do("key", loader) for _ in range(10)])
+    assert results == ["value"] * 10
+    assert calls == 1
+    assert flight.stats() == {"inflight": 0, "loads": 1, "coalesced": 9}
+
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_errors():
+    """Исключение загрузки получают все ожидающие, следующая загрузка идет заново."""
+    flight = SingleFlight()
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    results = await asyncio.gather(*[flight.do("key", failing) for _ in range(3)], return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results)
+
+    async def loader():
+        return "ok"
+
+    assert await flight.do("key", loader) == "ok"
+
+
+def test_should_refresh_early():
+    """Раннее обновление не срабатывает для далеких от истечения ключей и почти всегда - у самого истечения."""
+    assert not should_refresh_early(-1)
+    assert not any(should_refresh_early(3600, delta=1, beta=1) for _ in range(1000))
+    assert sum(should_refresh_early(0.01, delta=1, beta=1) for _ in range(1000)) > 950
+
+
+def test_link_record_roundtrip():
+    """Запись ссылки переживает кодирование в msgpack без потерь."""
+    record = CachedLink(
+        "https://example.com/a?b=1",
+        datetime(2025, 1, 2, 3, 4, 5, 678901),
+        datetime(2030, 1, 1),
+        42
+    )
+    assert unpack_link(pack_link(record)) == record
+    permanent = record._replace(expires_at=None, user_id=None)
+    assert unpack_link(pack_link(permanent)) == permanent
+    assert not permanent.is_expired()
+    assert record._replace(expires_at=datetime(2000, 1, 1)).is_expired()
+
+
+def test_link_record_rejects_legacy_values():
+    """Старые значения (голый URL), пустые и чужие по версии записи считаются промахом."""
+    assert unpack_link(None) is None
+    assert unpack_link(b"https://example.com/") is None
+    assert unpack_link(b"\xc1") is None
+    assert unpack_link(msgpack.packb([99, "https://example.com/", None, None, None])) is None
+
+@pytest.mark.asyncio
+async def test_cache_pipeline_splits_responses():
+    """Команды нескольких помощников уходят одним пайплайном, каждый получает свои ответы."""
+    async with redis.Redis(connection_pool=redis_pool) as client:
+        await client.set("test_pipeline_a", "1")
+        await client.hset("test_pipeline_b", mapping={"x": "2", "y": "3"})
+        async with cache_pipeline(client) as batch:
+            first = batch.add(lambda pipe: pipe.get("test_pipeline_a").ttl("test_pipeline_a"))
+            second = batch.add(lambda pipe: pipe.hmget("test_pipeline_b", "x", "y", "z"), lambda r: r[0])
+            assert first.value is None
+        assert first.value == ["1", -1]
+        assert second.value == ["2", "3", None]
+        await client.delete("test_pipeline_a", "test_pipeline_b")
+
+@pytest.mark.asyncio
+async def test_cache_pipeline_empty_batch():
+    async with redis.Redis(connection_pool=redis_pool) as client:
+        async with cache_pipeline(client) as batch:
+            ready = batch.add(lambda pipe: None, lambda r: "parsed")
+        assert ready.value is None
+
+def test_shared_redis_client():
+    """Клиент создается один раз на процесс поверх ограниченного пула."""
+    assert get_client() is get_client()
+    assert get_binary_client() is not get_client()
+    pool = get_client().connection_pool
+    assert pool.max_connections == REDIS_MAX_CONNECTIONS
+    assert pool.connection_kwargs["socket_timeout"] == REDIS_SOCKET_TIMEOUT
+
+def test_redis_retry_skips_timeouts():
+    """Повторяются только ошибки соединения: INCRBY/HINCRBY после таймаута чтения не повторяются."""
+    pool = get_client().connection_pool
+    connection = pool.connection_class(**pool.connection_kwargs)
+    assert tuple(connection.retry._supported_errors) == (redis.ConnectionError,)
+    assert connection.retry._retries == REDIS_RETRY_ATTEMPTS
@@ -0,0 +1,20 @@
+import pytest
+from src.clicks import ClickWriter
+
+def test_click_writer_drops_when_full():
+    """При переполнении очереди клики отбрасываются и учитываются в счетчике."""
+    writer = ClickWriter(maxsize=2)
+    for _ in range(5):
+        writer.record("short", "pytest", "127.0.0.1")
+    stats = writer.stats()
+    assert stats["queued"] == 2
+    assert stats["enqueued"] == 2
+    assert stats["dropped"] == 3
+
+@pytest.mark.asyncio
+async def test_click_writer_stop_without_events():
+    """Остановка без накопленных событий ничего не пишет."""
+    writer = ClickWriter()
+    writer.start()
+    await writer.stop()
+    assert writer.stats()["written"] == 0
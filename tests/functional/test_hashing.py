@@ -0,0 +1,24 @@
+import pytest
+from fastapi import HTTPException
+from src.hashing import PasswordHasher
+
+@pytest.mark.asyncio
+async def test_password_hasher_roundtrip():
+    """Хеширование и проверка пароля в пуле потоков."""
+    hasher = PasswordHasher(workers=1, rounds=4)
+    hashed_password = await hasher.hash("secret")
+    assert await hasher.verify("secret", hashed_password)
+    assert await hasher.verify("secret", hashed_password.encode("ascii"))
+    assert not await hasher.verify("wrong", hashed_password)
+    assert hasher.stats()["completed"] == 4
+    hasher.shutdown()
+
+@pytest.mark.asyncio
+async def test_password_hasher_rejects_when_queue_full():
+    """При заполненной очереди запрос сразу отклоняется с 503."""
+    hasher = PasswordHasher(workers=1, max_pending=0, rounds=4)
+    with pytest.raises(HTTPException) as exc_info:
+        await hasher.hash("secret")
+    assert exc_info.value.status_code == 503
+    assert hasher.stats()["rejected"] == 1
+    hasher.shutdown()
@@ -0,0 +1,64 @@
+import pytest
+import asyncio
+import uuid
+from datetime import datetime
+from sqlalchemy import select
+from src.database import Counter, Link
+from src.id_allocator import IdAllocator, COUNTER_ROW_ID
+import src.cache as cache
+
+def redis_key():
+    return f"test:counter:{uuid.uuid4().hex}"
+
+async def add_link(db, link_id: int):
+    db.add(Link(id=link_id, short_code=f"t{link_id}", original_url="https://example.com/", created_at=datetime.utcnow()))
+    await db.commit()
+
+@pytest.mark.asyncio
+async def test_db_allocator_reserves_blocks(test_db):
+    """Значения раздаются из блоков, а счетчик в БД двигается на блок за раз."""
+    first = IdAllocator(block_size=10, backend="db")
+    second = IdAllocator(block_size=10, backend="db")
+    values = await first.allocate_many(3, test_db)
+    start = (await test_db.execute(select(Counter.next_value).where(Counter.id == COUNTER_ROW_ID))).scalar_one()
+    assert values == list(range(start - 9, start - 6))
+
+    assert await second.allocate(test_db) == start + 1
+    # Пачка больше блока резервируется целиком
+    many = await first.allocate_many(30, test_db)
+    assert many[:7] == list(range(start - 6, start + 1))
+    assert len(set(many)) == 30
+    assert min(many[7:]) > start + 10
+
+@pytest.mark.asyncio
+async def test_redis_allocator_reseeds_after_data_loss(test_db):
+    """Потерянный или откатившийся ключ Redis не выдает уже занятые id."""
+    key = redis_key()
+    client = cache.get_client()
+    max_id = (await test_db.execute(select(Link.id).order_by(Link.id.desc()).limit(1))).scalar() or 0
+    await add_link(test_db, max_id + 1000)
+
+    allocator = IdAllocator(block_size=5, backend="redis", redis_key=key)
+    assert await allocator.allocate(test_db) == max_id + 1001
+
+    await add_link(test_db, max_id + 2000)
+    await client.delete(key) # FLUSHALL или рестарт без персистентности
+    restarted = IdAllocator(block_size=5, backend="redis", redis_key=key)
+    assert await restarted.allocate(test_db) == max_id + 2001
+
+    await add_link(test_db, max_id + 3000)
+    await client.set(key, 1) # отставшая реплика после failover
+    assert await IdAllocator(block_size=5, backend="redis", redis_key=key).allocate(test_db) == max_id + 3001
+    await client.delete(key)
+
+@pytest.mark.asyncio
+async def test_redis_allocator_concurrent_workers(test_db):
+    """Параллельные воркеры получают непересекающиеся значения."""
+    key = redis_key()
+    workers = [IdAllocator(block_size=7, backend="redis", redis_key=key) for _ in range(4)]
+    batches = await asyncio.gather(*[
+        worker.allocate_many(25, test_db) for worker in workers for _ in range(3)
+    ])
+    values = [value for batch in batches for value in batch]
+    assert len(values) == len(set(values)) == 300
+    await cache.get_client().delete(key)
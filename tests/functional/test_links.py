@@ -0,0 +1,39 @@
+import pytest
+import uuid
+from datetime import datetime
+from src.database import Link, LinkAlias
+from src.links import create_short_links_batch, find_link
+from src.models import LinkCreate
+import src.links as links
+
+@pytest.mark.asyncio
+async def test_batch_alias_taken_during_insert(test_db, monkeypatch):
+    """Alias, занятый параллельно после проверки, попадает в конфликты, остальная пачка создается."""
+    suffix = uuid.uuid4().hex[:8]
+    raced, free = f"raced_{suffix}", f"free_{suffix}"
+    allocate_many = links.id_allocator.allocate_many
+
+    async def allocate_and_race(count, db):
+        # Другой запрос успевает занять alias между проверкой и вставкой
+        competitor, = await allocate_many(1, db)
+        db.add(Link(id=competitor, short_code=raced, original_url="https://example.com/other", created_at=datetime.utcnow()))
+        await db.flush()
+        db.add(LinkAlias(alias=raced, link_id=competitor))
+        await db.commit()
+        return await allocate_many(count, db)
+
+    monkeypatch.setattr(links.id_allocator, "allocate_many", allocate_and_race)
+    batch = [
+        LinkCreate(original_url="https://example.com/raced", custom_alias=raced),
+        LinkCreate(original_url="https://example.com/free", custom_alias=free),
+        LinkCreate(original_url="https://example.com/generated"),
+    ]
+    response = await create_short_links_batch(batch, None, test_db)
+
+    assert response["created"] == 2
+    assert response["conflicts"] == [raced]
+    assert [result.status for result in response["results"]] == ["conflict", "created", "created"]
+    assert (await find_link(raced, test_db)).original_url == "https://example.com/other"
+    assert (await find_link(free, test_db)).original_url == "https://example.com/free"
+    generated = response["results"][2].short_code
+    assert (await find_link(generated, test_db)).original_url == "https://example.com/generated"
@@ -0,0 +1,30 @@
+from src.logs import setup_logging, get_logger, parse_route_settings
+import io
+import json
+
+def test_parse_route_settings():
+    assert parse_route_settings("links.redirect=0.01, auth=DEBUG,broken,") == {
+        "links.redirect": "0.01",
+        "auth": "DEBUG"
+    }
+
+def test_logging_structured_and_sampled():
+    """Логи пишутся через очередь JSON-строками; сэмплирование не трогает предупреждения."""
+    stream = io.StringIO()
+    listener = setup_logging(
+        level="DEBUG",
+        log_format="json",
+        route_levels="test.quiet=WARNING",
+        sample_rates="test.sampled=0",
+        stream=stream
+    )
+    get_logger("test.route").info("Кэш HIT", extra={"short_code": "abc"})
+    get_logger("test.quiet").info("не попадет в лог")
+    get_logger("test.sampled").debug("отброшено сэмплированием")
+    get_logger("test.sampled").warning("предупреждение")
+    listener.stop()
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [line["message"] for line in lines] == ["Кэш HIT", "предупреждение"]
+    assert lines[0]["short_code"] == "abc"
+    assert lines[0]["logger"] == "shortener.test.route"
+    assert lines[1]["level"] == "WARNING"
@@ -0,0 +1,152 @@
+import pytest
+import asyncio
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+import src.database as database
+from src.migrations import MIGRATIONS, run_migrations, resolve_links_by_id
+from src.id_allocator import IdAllocator
+from src.links import find_link
+from src.short_codes import ShortCodeCodec, short_codes
+
+# Схема до первых миграций: short_code с уникальным индексом, без original_url_hash и link_aliases
+BASELINE_SCHEMA = [
+    """CREATE TABLE users (
+        id INTEGER PRIMARY KEY,
+        username VARCHAR UNIQUE,
+        hashed_password VARCHAR,
+        email VARCHAR UNIQUE,
+        created_at TIMESTAMP
+    )""",
+    """CREATE TABLE links (
+        id INTEGER PRIMARY KEY,
+        short_code VARCHAR,
+        original_url VARCHAR,
+        created_at TIMESTAMP,
+        expires_at TIMESTAMP,
+        user_id INTEGER REFERENCES users (id)
+    )""",
+    "CREATE UNIQUE INDEX ix_links_short_code ON links (short_code)",
+    """CREATE TABLE link_stats (
+        id INTEGER PRIMARY KEY,
+        link_id INTEGER REFERENCES links (id),
+        created_at TIMESTAMP,
+        user_agent VARCHAR,
+        ip_address VARCHAR
+    )""",
+    "CREATE TABLE counter (id INTEGER PRIMARY KEY, next_value BIGINT)",
+]
+LATEST = MIGRATIONS[-1][0]
+
+async def create_baseline(url: str, links: list[tuple[int, str, str]], counter: int):
+    engine = database.create_engine_for_url(url)
+    async with engine.begin() as conn:
+        for ddl in BASELINE_SCHEMA:
+            await conn.execute(text(ddl))
+        await conn.execute(
+            text("INSERT INTO links (id, short_code, original_url, created_at) VALUES (:id, :code, :url, CURRENT_TIMESTAMP)"),
+            [{"id": link_id, "code": code, "url": url} for link_id, code, url in links]
+        )
+        await conn.execute(text("INSERT INTO counter (id, next_value) VALUES (1, :value)"), {"value": counter})
+    return engine
+
+async def schema_versions(engine) -> list[int]:
+    async with engine.connect() as conn:
+        result = await conn.execute(text("SELECT version FROM schema_version ORDER BY version"))
+        return list(result.scalars())
+
+@pytest.mark.asyncio
+async def test_migrations_upgrade_baseline_and_rerun(tmp_path):
+    """Старая база доводится до последней версии, повторный запуск ничего не меняет."""
+    engine = await create_baseline(
+        f"sqlite+aiosqlite:///{tmp_path}/baseline.db",
+        [(1, "1", "https://example.com/#/a"), (2, "2", "https://example.com/b")],
+        counter=2
+    )
+    assert await run_migrations(engine) == LATEST
+    async with engine.connect() as conn:
+        columns = {row[1] for row in await conn.execute(text("PRAGMA table_info(links)"))}
+        indexes = {row[1] for row in await conn.execute(text("PRAGMA index_list(links)"))}
+        hashes = (await conn.execute(text("SELECT COUNT(*) FROM links WHERE original_url_hash IS NULL"))).scalar()
+    assert "original_url_hash" in columns
+    assert "ix_links_user_id_original_url_hash" in indexes
+    assert "ix_links_short_code" not in indexes
+    assert hashes == 0
+
+    assert await run_migrations(engine) == LATEST
+    assert await schema_versions(engine) == list(range(1, LATEST + 1))
+    await engine.dispose()
+
+@pytest.mark.asyncio
+async def test_migrations_concurrent_workers(tmp_path):
+    """Два воркера, стартующие вместе на старой базе, применяют каждую миграцию один раз."""
+    url = f"sqlite+aiosqlite:///{tmp_path}/concurrent.db"
+    first = await create_baseline(
+        url,
+        [(i, f"c{i}", f"https://example.com/{i}") for i in range(1, 3001)],
+        counter=3000
+    )
+    second = database.create_engine_for_url(url)
+    assert await asyncio.gather(run_migrations(first), run_migrations(second)) == [LATEST, LATEST]
+    assert await schema_versions(first) == list(range(1, LATEST + 1))
+    async with first.connect() as conn:
+        aliases = (await conn.execute(text("SELECT COUNT(*) FROM link_aliases"))).scalar()
+    assert aliases == 3000
+    await first.dispose()
+    await second.dispose()
+
+@pytest.mark.asyncio
+async def test_migration_keeps_old_codes_and_aliases(tmp_path):
+    """Коды старого счетчика и пользовательские alias продолжают открываться, счетчик выше max(id)."""
+    links = [
+        (1, "1", "https://example.com/1"),
+        (2, "5", "https://example.com/2"), # счетчик и id разошлись
+        (7, "my-alias", "https://example.com/7"),
+        (9, "b", "https://example.com/9"),
+    ]
+    engine = await create_baseline(f"sqlite+aiosqlite:///{tmp_path}/codes.db", links, counter=5)
+    assert await run_migrations(engine) == LATEST
+    # Повторный перенос alias не падает на уже существующих строках
+    async with engine.begin() as conn:
+        await resolve_links_by_id(conn)
+
+    async with AsyncSession(engine) as db:
+        for link_id, code, url in links:
+            db_link = await find_link(code, db)
+            assert db_link is not None and db_link.id == link_id and db_link.original_url == url
+        next_id = await IdAllocator(block_size=1, backend="db").allocate(db)
+        assert next_id == 10
+        assert await find_link(short_codes.encode(next_id), db) is None
+    await engine.dispose()
+
+@pytest.mark.asyncio
+async def test_short_code_settings_change_keeps_links(tmp_path):
+    """Коды, выданные с другой длиной или ключом, после старта открываются через link_aliases."""
+    engine = database.create_engine_for_url(f"sqlite+aiosqlite:///{tmp_path}/settings.db")
+    async with engine.begin() as conn:
+        await conn.run_sync(database.Base.metadata.create_all)
+    await run_migrations(engine)
+
+    old_codes = {
+        3: ShortCodeCodec(length=short_codes.length + 1, secret="test-secret").encode(3),
+        4: ShortCodeCodec(secret="old-secret").encode(4),
+        5: short_codes.encode(5),
+    }
+    async with engine.begin() as conn:
+        await conn.execute(
+            text("INSERT INTO links (id, short_code, original_url, created_at) VALUES (:id, :code, 'https://example.com/', CURRENT_TIMESTAMP)"),
+            [{"id": link_id, "code": code} for link_id, code in old_codes.items()]
+        )
+        await conn.execute(text("UPDATE short_code_settings SET fingerprint = 'old'"))
+    await run_migrations(engine)
+
+    async with AsyncSession(engine) as db:
+        for link_id, code in old_codes.items():
+            db_link = await find_link(code, db)
+            assert db_link is not None and db_link.id == link_id
+    async with engine.connect() as conn:
+        aliases = (await conn.execute(text("SELECT COUNT(*) FROM link_aliases"))).scalar()
+        stored = (await conn.execute(text("SELECT fingerprint FROM short_code_settings"))).scalars().all()
+    # Код текущих настроек декодируется в id и в alias не попадает
+    assert aliases == 2
+    assert stored == [short_codes.fingerprint]
+    await engine.dispose()
@@ -1,5 +1,6 @@
 import pytest
-from src.utils import encode, decode
+from src.utils import encode, decode, encode_many, decode_many, is_base62, normalize_url, url_hash
+from src.short_codes import ShortCodeCodec
 
 @pytest.mark.parametrize("num, expected", [
     (0, "0"),  
@@ -27,4 +28,82 @@ def test_decode_small_strings(string, expected):
 ])
 def test_decode_invalid_characters(string):
     with pytest.raises(ValueError):
-        decode(string)
\ No newline at end of file
+        decode(string)
+
+@pytest.mark.parametrize("num", [0, 61, 62, 3843, 3844, 62 ** 7 - 1, 62 ** 7, 10 ** 30])
+def test_encode_decode_roundtrip(num):
+    assert decode(encode(num)) == num
+
+@pytest.mark.parametrize("num, error", [
+    (-1, ValueError),
+    (1.5, TypeError),
+    ("1", TypeError),
+])
+def test_encode_invalid_input(num, error):
+    with pytest.raises(error):
+        encode(num)
+
+def test_decode_empty_string():
+    with pytest.raises(ValueError):
+        decode("")
+
+@pytest.mark.parametrize("string, max_length, expected", [
+    ("aZ9", None, True),
+    ("aZ9", 2, False),
+    ("a-b", None, False),
+    ("", None, False),
+    ("ёж", None, False),
+])
+def test_is_base62(string, max_length, expected):
+    assert is_base62(string, max_length) is expected
+
+def test_encode_decode_many():
+    nums = [0, 1, 62, 3844, 916132831]
+    codes = encode_many(nums)
+    assert codes == [encode(num) for num in nums]
+    assert decode_many(codes) == nums
+
+def test_encode_decode_many_numpy():
+    np = pytest.importorskip("numpy")
+    nums = [0, 9, 61, 62, 3843, 3844, 62 ** 10 - 1]
+    codes = encode_many(np.array(nums, dtype=np.int64))
+    assert codes == [encode(num) for num in nums]
+    assert decode_many(codes, as_array=True).tolist() == nums
+    with pytest.raises(ValueError):
+        decode_many(["abc", "a-c"], as_array=True)
+
+@pytest.mark.parametrize("length", [1, 2, 3])
+def test_short_code_permutation_is_bijective(length):
+    codec = ShortCodeCodec(length=length, secret="test")
+    permuted = [codec.permute(num) for num in range(codec.domain)]
+    assert sorted(permuted) == list(range(codec.domain))
+    assert [codec.unpermute(num) for num in permuted] == list(range(codec.domain))
+
+def test_short_code_codec():
+    codec = ShortCodeCodec(length=7, secret="test")
+    codes = codec.encode_many(range(1, 101))
+    assert codes == [codec.encode(num) for num in range(1, 101)]
+    assert all(len(code) == 7 for code in codes)
+    assert [codec.decode(code) for code in codes] == list(range(1, 101))
+    assert codes != sorted(codes)
+    assert ShortCodeCodec(length=7, secret="other").encode(1) != codes[0]
+    assert codec.decode("abc") is None
+    assert codec.decode("abc-def") is None
+    with pytest.raises(ValueError):
+        codec.encode(62 ** 7)
+    with pytest.raises(ValueError):
+        ShortCodeCodec(length=7, secret="")
+
+@pytest.mark.parametrize("url, expected", [
+    ("https://mail.ru", "https://mail.ru/"),
+    ("HTTPS://Mail.RU:443/Path?q=1#frag", "https://mail.ru/Path?q=1#frag"),
+    ("https://app.example.com/#/page2", "https://app.example.com/#/page2"),
+    ("http://example.com:8080/", "http://example.com:8080/"),
+])
+def test_normalize_url(url, expected):
+    assert normalize_url(url) == expected
+
+def test_url_hash_fixed_length():
+    assert len(url_hash("https://mail.ru")) == 64
+    assert url_hash("https://mail.ru") == url_hash("https://MAIL.ru:443/")
+    assert url_hash("https://app.example.com/#/page1") != url_hash("https://app.example.com/#/page2")
@@ -0,0 +1,18 @@
+from benchmarks.workload import ZipfSampler, percentile, latency_summary
+import random
+
+def test_percentile_nearest_rank():
+    samples = [i / 1000 for i in range(1, 101)]
+    assert percentile(samples, 0.50) == 0.050
+    assert percentile(samples, 0.99) == 0.099
+    assert percentile([], 0.95) == 0.0
+    summary = latency_summary(samples, errors=2, duration=2.0)
+    assert summary["p95_ms"] == 95.0
+    assert summary["throughput_rps"] == 50.0
+
+def test_zipf_sampler_prefers_hot_links():
+    sample = ZipfSampler(100, 1.1, random.Random(1))
+    counts = [0] * 100
+    for _ in range(10000):
+        counts[sample()] += 1
+    assert counts[0] > counts[9] > counts[99]